@@ -1,12 +1,22 @@
 import os
-import requests
+import math
+import time
+import asyncio
 import logging
-import redis
-import json
+
+import http_client
+
+from ares_mirror import ares_mirror
+from cache import HotKeyTracker, cache, negative_entry, parse_negative_entry
+from codec import DataclassCodec, SchemaMismatch
+from name_search import name_index
+from ratelimit import RateLimited
+from tracing import span
 
 from dataclasses import dataclass
-from typing import List, Optional
-import pandas as pd
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from reference_data import NaceNode, legal_forms, load_reference_data  # noqa: F401 (legal_forms re-export)
 
 
 
@@ -16,125 +26,24 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 
-redis_host_name = os.environ.get("REDIS_HOST_NAME", "localhost")
-
-try:
-    redis_instance = redis.Redis(host=redis_host_name, port=6379, db=0)
-except redis.RedisError as e:
-    logging.error(f"Nepodařilo se připojit k Redisu: {e}")
-    redis_instance = None
-
-
-# Rozšíření slovníku pro právní formy
-legal_forms = {
-    "100": "Podnikající fyzická osoba tuzemská fyzická osoba",
-    "111": "Veřejná obchodní společnost",
-    "112": "Společnost s ručením omezeným",
-    "113": "Společnost komanditní",
-    "114": "Společnost komanditní na akcie",
-    "115": "Společný podnik",
-    "116": "Zájmové sdružení",
-    "117": "Nadace",
-    "118": "Nadační fond",
-    "121": "Akciová společnost",
-    "131": "Svépomocné zemědělské družstvo",
-    "141": "Obecně prospěšná společnost",
-    "145": "Společenství vlastníků jednotek",
-    "151": "Komoditní burza",
-    "152": "Garanční fond obchodníků s cennými papíry",
-    "161": "Ústav",
-    "201": "Zemědělské družstvo",
-    "205": "Družstvo",
-    "211": "Družstevní podnik zemědelský",
-    "231": "Výrobní družstvo",
-    "232": "Spotřební družstvo",
-    "233": "Bytové družstvo",
-    "234": "Jiné družstvo",
-    "241": "Družstevní podnik (s 1 zakladatelem)",
-    "242": "Společný podnik (s více zakladateli)",
-    "251": "Zájmová organizace družstev",
-    "261": "Společná zájmová organizace družstev",
-    "301": "Státní podnik",
-    "302": "Národní podnik",
-    "311": "Státní banka československá",
-    "312": "Banka-státní peněžní ústav",
-    "313": "Česká národní banka",
-    "314": "Česká konsolidační agentura",
-    "325": "Organizační složka státu",
-    "326": "Stálý rozhodčí soud",
-    "331": "Příspěvková organizace zřízená územním samosprávným celkem",
-    "332": "Státní příspěvková organizace",
-    "333": "Státní příspěvková organizace ostatní",
-    "341": "Státní hospodářská organizace řízená okresním úřadem",
-    "343": "Obecní podnik",
-    "351": "Československé státní dráhy-státní organizace",
-    "352": "Správa železniční dopravní cesty, státní organizace",
-    "353": "Rada pro veřejný dohled nad auditem",
-    "361": "Veřejnoprávní instituce",
-    "362": "Česká tisková kancelář",
-    "381": "Státní fond ze zákona",
-    "382": "Státní fond ze zákona nezapisující se do obchodního rejstříku",
-    "391": "Zdravotní pojišťovna (mimo VZP)",
-    "392": "Všeobecná zdravotní pojišťovna",
-    "401": "Sdružení mezinárodního obchodu",
-    "411": "Podnik se zahraniční majetkovou účastí",
-    "421": "Odštěpný závod zahraniční právnické osoby",
-    "422": "Organizační složka zahraničního nadačního fondu",
-    "423": "Organizační složka zahraniční nadace",
-    "424": "Zahraniční fyzická osoba fyzická osoba",
-    "425": "Odštěpný závod zahraniční fyzické osoby",
-    "426": "Zastoupení zahraniční banky",
-    "441": "Podnik zahraničního obchodu",
-    "442": "Účelová zahraničně obchodní organizace",
-    "501": "Odštěpný závod",
-    "521": "Samostatná drobná provozovna (obecního úřadu)",
-    "525": "Vnitřní organizační jednotka organizační složky státu",
-    "601": "Vysoká škola (veřejná, státní)",
-    "641": "Školská právnická osoba",
-    "661": "Veřejná výzkumná instituce",
-    "671": "Veřejné neziskové ústavní zdravotnické zařízení",
-    "701": "Občanské sdružení",
-    "703": "Odborová organizace a organizace zaměstnavatelů",
-    "704": "Zvláštní organizace pro zastoupení českých zájmů v mezinárodních nevládních organizacích",
-    "705": "Podnik nebo hospodářské zařízení sdružení",
-    "706": "Spolek",
-    "707": "Odborová organizace",
-    "708": "Organizace zaměstnavatelů",
-    "711": "Politická strana, politické hnutí",
-    "715": "Podnik nebo hospodářské zařízení politické strany",
-    "721": "Církve a náboženské společnosti",
-    "722": "Evidované církevní právnické osoby",
-    "723": "Svazy církví a náboženských společností",
-    "731": "Organizační jednotka občanského sdružení",
-    "733": "Pobočná odborová organizace a organizace zaměstnavatelů",
-    "734": "Organizační jednotka zvláštní organizace pro zastoupení českých zájmů v mezinárodních nevládních organizacích",
-    "736": "Pobočný spolek",
-    "741": "Samosprávná stavovská organizace (profesní komora)",
-    "745": "Komora (hospodářská, agrární)",
-    "751": "Zájmové sdružení právnických osob",
-    "761": "Honební společenstvo",
-    "771": "Dobrovolný svazek obcí",
-    "801": "Obec",
-    "804": "Kraj",
-    "805": "Regionální rada regionu soudržnosti",
-    "811": "Městská část, městský obvod",
-    "906": "Zahraniční spolek",
-    "907": "Mezinárodní odborová organizace",
-    "908": "Mezinárodní organizace zaměstnavatelů",
-    "921": "Mezinárodní nevládní organizace",
-    "922": "Organizační jednotka mezinárodní nevládní organizace",
-    "931": "Evropské hospodářské zájmové sdružení",
-    "932": "Evropská společnost",
-    "933": "Evropská družstevní společnost",
-    "936": "Zahraniční pobočný spolek",
-    "937": "Pobočná mezinárodní odborová organizace",
-    "938": "Pobočná mezinárodní organizace zaměstnavatelů",
-    "941": "Evropské seskupení pro územní spolupráci",
-    "960": "Právnická osoba zřízená zvláštním zákonem zapisovaná do veřejného rejstříku",
-    "961": "Svěřenský fond",
-    "962": "Zahraniční svěřenský fond"
-}
+ares_base_url = os.environ.get("ARES_BASE_URL", "https://ares.gov.cz/ekonomicke-subjekty-v-be/rest")
 
+# Počet IČO v jednom dotazu na hromadné vyhledávání ARES
+ARES_BULK_CHUNK_SIZE = int(os.environ.get("ARES_BULK_CHUNK_SIZE", 100))
+# Po ARES_SOFT_TTL se záznam vrací jako zastaralý a obnoví se na pozadí,
+# po ARES_HARD_TTL zmizí z cache úplně
+ARES_SOFT_TTL = int(os.environ.get("ARES_SOFT_TTL", 60 * 5))
+ARES_HARD_TTL = int(os.environ.get("ARES_HARD_TTL", 60 * 60))
+# Jak dlouho se pamatuje, že IČO v ARES neexistuje
+ARES_NEGATIVE_TTL = int(os.environ.get("ARES_NEGATIVE_TTL", 60 * 10))
+ARES_NOT_FOUND = "ares-not-found"
+# Kolik nejžádanějších IČO a jak často se obnovuje dopředu, 0 vypne obnovování
+ARES_REFRESH_TOP_N = int(os.environ.get("ARES_REFRESH_TOP_N", 100))
+ARES_REFRESH_INTERVAL = float(os.environ.get("ARES_REFRESH_INTERVAL", 60))
+ARES_REFRESH_CONCURRENCY = 10
+
+hot_companies = HotKeyTracker()
+_refresh_tasks: Dict[str, asyncio.Task] = {}
 
 
 @dataclass
@@ -148,90 +57,352 @@ class AresCompany:
     size: Optional[str]
     main_cz_nace: Optional[str] = None
     based_main_cz_nace: Optional[str] = None
+    main_cz_nace_hierarchy: Optional[List[NaceNode]] = None
+
+
+# Při přejmenování nebo přeházení polí AresCompany je potřeba zvýšit verzi
+company_codec = DataclassCodec(AresCompany, version=1)
+
+
+@dataclass
+class AresCompanyResult:
+    company: Optional[AresCompany] = None
+    error: Optional[str] = None
+
 
 def translate_legal_form(legal_form_code: str) -> str:
     # Vrátí textovou reprezentaci právní formy, pokud je kód známý, jinak vrátí původní kód
-    return legal_forms.get(legal_form_code, legal_form_code)
+    return load_reference_data().legal_form(legal_form_code)
 
 
 def find_cznace_description(key, csv_path: str = "cznace.csv"):
-    try:
-        df = pd.read_csv(csv_path, delimiter=';', dtype={'id_cznace': str})
-        description = df.loc[df['id_cznace'] == key, 'text_cznace'].values
-        if len(description) > 0:
-            return description[0]
-        else:
-            logging.info(f'Žádný popis pro id_cznace: {key} nebyl nalezen.')
-            return None
-    except Exception as e:
-        logging.error(f'Chyba při načítání nebo vyhledávání v souboru {csv_path}: {e}')
-        return None
+    return load_reference_data(cznace_path=csv_path).describe(key)
 
 def find_company_size(chodnota, csv_path: str = "pocet_pracovniku.csv"):
-    try:
-        df = pd.read_csv(csv_path, delimiter=',', dtype={'chodnota': str})
-        size_text = df.loc[df['chodnota'] == chodnota, 'zkrtext'].values
-        if len(size_text) > 0:
-            return size_text[0]
-        else:
-            logging.info(f'Žádná velikost společnosti pro chodnota: {chodnota} nebyla nalezena.')
-            return None
-    except Exception as e:
-        logging.error(f'Chyba při načítání nebo vyhledávání v souboru {csv_path}: {e}')
-        return None
+    return load_reference_data(sizes_path=csv_path).company_size(chodnota)
 
 
 
-def new_get_company_data_ares(ico: str, redis_key_suffix:str = "_company_data_test") -> Optional[AresCompany]:
+def parse_ares_record(record: dict) -> AresCompany:
+    reference_data = load_reference_data()
+    address_components = record.get('sidlo') or {}
+    psc = address_components.get('psc')
+    statistical_data = record.get('statistickeUdaje') or {}
+
+    return AresCompany(
+        ico=record.get('ico'),
+        name=record.get('obchodniJmeno'),
+        address=address_components.get('textovaAdresa'),
+        psc=str(psc) if psc else None,
+        legal_form=reference_data.legal_form(record.get('pravniForma')),
+        business_fields=reference_data.describe_many(record.get('czNace') or []),
+        size=reference_data.company_size(statistical_data.get("kategoriePoctuPracovniku")),
+    )
+
+
+async def new_get_company_data_ares(ico: str, redis_key_suffix:str = "_company_data_test") -> Optional[AresCompany]:
     redis_key = f"{ico}{redis_key_suffix}"
 
+    # Lokální zrcadlo z hromadných dat ARES, funguje i při výpadku ARES
+    with span("ares_mirror"):
+        company_data = decode_mirrored_company(ares_mirror.get(ico))
+    if company_data is not None:
+        name_index.add(company_data.ico, company_data.name)
+        return company_data
+
     # Zkusí najít data v Redisu
-    cached_data = redis_instance.get(redis_key)
-    if cached_data:
+    with span("ares_cache"):
+        cached_data = await cache.get(redis_key)
+        if parse_negative_entry(cached_data) is not None:
+            logging.info(f"IČO {ico} v ARES neexistuje (negativní cache).")
+            return None
+        cached = decode_cached_company(cached_data)
+    if cached is not None:
         logging.info("Data nalezena v Redisu.")
-        # Deserializace dat z JSON stringu zpět do objektu AresCompany
-        return AresCompany(**json.loads(cached_data))
+        company_data, fetched_at = cached
+        name_index.add(company_data.ico, company_data.name)
+        hot_companies.touch(redis_key, fetched_at)
+        if time.time() - fetched_at >= ARES_SOFT_TTL:
+            # Zastaralý záznam se vrátí hned a obnoví se na pozadí
+            schedule_refresh(ico, redis_key)
+        return company_data
+
+    # Souběžné dotazy na stejné IČO počkají na jediné stažení z ARES
+    return await cache.coalesce(redis_key, lambda: fetch_company_data_ares(ico, redis_key), decode_company)
+
+
+def encode_company(company_data: AresCompany) -> bytes:
+    # Binární záznam spolu s časem stažení z ARES
+    return company_codec.encode(company_data, fetched_at=time.time())
+
+
+def decode_cached_company(cached_data: Optional[bytes]) -> Optional[Tuple[AresCompany, float]]:
+    """
+    Returns:
+    tuple|None: (company, time it was fetched from ARES), None for a miss or an entry in an old format.
+    """
+    if cached_data is None:
+        return None
+    try:
+        return company_codec.decode_with_time(cached_data)
+    except SchemaMismatch as e:
+        logging.info(f"Záznam v cache ve starém formátu, stáhne se znovu: {e}")
+        return None
+
+
+def decode_mirrored_company(data: Optional[bytes]) -> Optional[AresCompany]:
+    if data is None:
+        return None
+    try:
+        return company_codec.decode(data)
+    except SchemaMismatch as e:
+        # Zrcadlo je ze starší verze AresCompany, je potřeba znovu spustit ingest
+        logging.warning(f"Záznam zrcadla ARES ve starém formátu: {e}")
+        return None
+
+
+def decode_company(cached_data: bytes) -> Optional[AresCompany]:
+    if parse_negative_entry(cached_data) is not None:
+        return None
+    return company_codec.decode(cached_data)
+
 
+def decode_refreshed_company(cached_data: bytes) -> Optional[AresCompany]:
+    """
+    decode_company for refreshes: the stale record being replaced doesn't count as the new value.
+    """
+    if parse_negative_entry(cached_data) is not None:
+        return None
+    company, fetched_at = company_codec.decode_with_time(cached_data)
+    if time.time() - fetched_at >= ARES_SOFT_TTL:
+        raise ValueError(f"Record fetched at {fetched_at} is still stale.")
+    return company
+
+
+def schedule_refresh(ico: str, redis_key: str):
+    if redis_key in _refresh_tasks:
+        return
+    task = asyncio.ensure_future(refresh_company(ico, redis_key))
+    _refresh_tasks[redis_key] = task
+    task.add_done_callback(lambda done: _refresh_finished(redis_key, done))
+
+
+async def refresh_company(ico: str, redis_key: str) -> Optional[AresCompany]:
+    # L1 tohoto workeru může držet starou verzi, kterou jiný worker v Redisu už obnovil
+    cached_data, = await cache.mget([redis_key], local=False)
+    cached = decode_cached_company(cached_data) if parse_negative_entry(cached_data) is None else None
+    if cached is not None and time.time() - cached[1] < ARES_SOFT_TTL:
+        hot_companies.mark_fetched(redis_key, cached[1])
+        return cached[0]
+    return await cache.coalesce(redis_key, lambda: fetch_company_data_ares(ico, redis_key), decode_refreshed_company)
+
+
+def _refresh_finished(redis_key: str, task: asyncio.Task):
+    _refresh_tasks.pop(redis_key, None)
+    # Např. vyčerpaný limit ARES; zastaralý záznam zůstává v cache
+    if not task.cancelled() and task.exception() is not None:
+        logging.warning(f"Obnova {redis_key} na pozadí selhala: {task.exception()}")
+
+
+async def refresh_hot_companies(top_n: int = ARES_REFRESH_TOP_N, redis_key_suffix: str = "_company_data_test"):
+    """
+    Renew the most requested companies that would go stale before the next round.
+
+    Every worker runs this over its own access counts, so keys another
+    worker has already renewed (fresh in Redis) are skipped and refreshes
+    go through cache.coalesce, letting one worker fetch a key at a time.
+    """
+    now = time.time()
+    due = [
+        redis_key for redis_key, fetched_at in hot_companies.hottest(top_n)
+        if now - fetched_at + ARES_REFRESH_INTERVAL >= ARES_SOFT_TTL and redis_key.endswith(redis_key_suffix)
+    ]
+    hot_companies.decay()
+    if not due:
+        return
+
+    # Co mezitím obnovil jiný worker, je v Redisu, lokální L1 může být starší
+    stale = []
+    for redis_key, cached_data in zip(due, await cache.mget(due, local=False)):
+        if parse_negative_entry(cached_data) is not None:
+            continue
+        cached = decode_cached_company(cached_data)
+        if cached is not None and now - cached[1] + ARES_REFRESH_INTERVAL < ARES_SOFT_TTL:
+            hot_companies.mark_fetched(redis_key, cached[1])
+            continue
+        stale.append(redis_key)
+    if not stale:
+        return
 
-    ares_url: str = f'https://ares.gov.cz/ekonomicke-subjekty-v-be/rest/ekonomicke-subjekty-res/{ico}'
-    response = requests.get(ares_url, headers={'accept': 'application/json'})
+    logging.info(f"Obnovuji {len(stale)} nejžádanějších záznamů ARES.")
+    semaphore = asyncio.Semaphore(ARES_REFRESH_CONCURRENCY)
+
+    async def refresh(redis_key: str):
+        if redis_key in _refresh_tasks:
+            return
+        ico = redis_key[:-len(redis_key_suffix)]
+        async with semaphore:
+            await cache.coalesce(redis_key, lambda: fetch_company_data_ares(ico, redis_key), decode_refreshed_company)
+
+    await asyncio.gather(*(refresh(redis_key) for redis_key in stale))
+
+
+async def run_hot_company_refresher():
+    while True:
+        await asyncio.sleep(ARES_REFRESH_INTERVAL)
+        try:
+            await refresh_hot_companies()
+        except Exception as e:
+            logging.error(f"Obnova záznamů ARES selhala: {e}")
+
+
+async def fetch_company_data_ares(ico: str, redis_key: str) -> Optional[AresCompany]:
+    """
+    Download a company from ARES and store it in the cache.
+
+    Returns:
+    AresCompany|None: None when ARES doesn't know the IČO (4xx or no records).
+
+    Raises:
+    http_client.HttpError: When ARES is unavailable: connection error, deadline, open circuit breaker, 5xx or 429.
+    """
+    ares_url: str = f'{ares_base_url}/ekonomicke-subjekty-res/{ico}'
+    try:
+        with span("ares_fetch"):
+            response = await http_client.get("ares", ares_url, headers={'accept': 'application/json'})
+    except http_client.HttpError as e:
+        # Výpadek ARES neznamená, že IČO neexistuje
+        logging.error(f"Request to {ares_url} failed: {e}")
+        raise
     if response.status_code != 200:
         logging.error(f"Status code for request to {ares_url} is {response.status_code}")
-        return None
+        # Neexistující nebo neplatné IČO se zapamatuje, výpadky ARES (5xx, 429) ne
+        if 400 <= response.status_code < 500 and response.status_code != 429:
+            await cache.set(redis_key, negative_entry(ARES_NOT_FOUND), ttl=ARES_NEGATIVE_TTL)
+            return None
+        response.raise_for_status()
 
     data = response.json()
     records = data.get("zaznamy", [])
     if not records:
         logging.error("Žádné záznamy.")
+        await cache.set(redis_key, negative_entry(ARES_NOT_FOUND), ttl=ARES_NEGATIVE_TTL)
         return None
 
-    record:dict = records[0]
-    address_components = record.get('sidlo', {})
-    address = address_components.get('textovaAdresa')
-    psc = address_components.get('psc')
-    business_field_codes = record.get('czNace', [])
-    business_field_descriptions = [find_cznace_description(code) for code in business_field_codes if isinstance(find_cznace_description(code), str)]
-    kategorie_poctu_pracovniku:str = record.get("statistickeUdaje").get("kategoriePoctuPracovniku")
-
-    company_data = AresCompany(
-        ico=record.get('ico'),
-        name=record.get('obchodniJmeno'),
-        address=address,
-        psc=str(psc) if psc else None,
-        legal_form=translate_legal_form(record.get('pravniForma')),
-        business_fields=business_field_descriptions,
-        size=find_company_size(kategorie_poctu_pracovniku)
-    )
+    # Včetně překladu kódů CZ-NACE na popisy
+    with span("ares_parse"):
+        company_data = parse_ares_record(records[0])
 
-    # Serializace dat do JSON stringu a uložení do Redisu na 5 minut
-    redis_instance.set(redis_key, json.dumps(company_data.__dict__), ex=60*5)
+    await cache.set(redis_key, encode_company(company_data), ttl=ARES_HARD_TTL)
+    hot_companies.mark_fetched(redis_key, time.time())
+    name_index.add(company_data.ico, company_data.name)
 
     return company_data
 
 
+async def search_companies_ares(icos: List[str]) -> Dict[str, AresCompany]:
+    """
+    Look up several companies with one call to the ARES bulk search.
+
+    Parameters:
+    icos (List[str]): At most ARES_BULK_CHUNK_SIZE eight-digit IČOs.
+
+    Returns:
+    Dict[str, AresCompany]: Found companies by IČO, IČOs unknown to ARES are missing.
+
+    Raises:
+    http_client.HttpError: When the request fails or ARES answers with an error status.
+    RateLimited: When the ARES budget is used up.
+    """
+    ares_url = f'{ares_base_url}/ekonomicke-subjekty/vyhledat'
+    payload = {"start": 0, "pocet": len(icos), "ico": icos}
+    response = await http_client.post("ares", ares_url, json=payload, headers={'accept': 'application/json'})
+    response.raise_for_status()
+
+    companies = {}
+    for record in response.json().get("ekonomickeSubjekty", []):
+        company = parse_ares_record(record)
+        if company.ico:
+            companies[company.ico] = company
+    return companies
+
+
+async def get_companies_data_ares(
+    icos: Iterable[str], redis_key_suffix: str = "_company_data_test", index_names: bool = True
+) -> Dict[str, AresCompanyResult]:
+    """
+    Get many companies at once: cached ones with a single MGET, the rest
+    through the ARES bulk search in chunks of ARES_BULK_CHUNK_SIZE.
+
+    Parameters:
+    icos (Iterable[str]): Validated eight-digit IČOs, duplicates are ignored.
+    index_names (bool): Add the found names to the /search index; off for bulk_enrich,
+        which doesn't serve /search and would keep millions of names in memory.
+
+    Returns:
+    Dict[str, AresCompanyResult]: Company or error message for every requested IČO.
+    """
+    icos = list(dict.fromkeys(icos))
+    if not icos:
+        return {}
+
+    results: Dict[str, AresCompanyResult] = {}
+    for ico, data in ares_mirror.get_many(icos).items():
+        company_data = decode_mirrored_company(data)
+        if company_data is not None:
+            results[ico] = AresCompanyResult(company=company_data)
+    icos = [ico for ico in icos if ico not in results]
+
+    cached_values = await cache.mget([f"{ico}{redis_key_suffix}" for ico in icos])
+    missing = []
+    for ico, cached_data in zip(icos, cached_values):
+        if parse_negative_entry(cached_data) is not None:
+            results[ico] = AresCompanyResult(error="IČO doesn´t found.")
+            continue
+        cached = decode_cached_company(cached_data)
+        if cached is None:
+            missing.append(ico)
+            continue
+        company_data, fetched_at = cached
+        if time.time() - fetched_at >= ARES_SOFT_TTL:
+            schedule_refresh(ico, f"{ico}{redis_key_suffix}")
+        results[ico] = AresCompanyResult(company=company_data)
+    logging.info(f"Hromadný dotaz: {len(results)} IČO ze zrcadla a z Redisu, {len(missing)} z ARES.")
+
+    chunks = [missing[i:i + ARES_BULK_CHUNK_SIZE] for i in range(0, len(missing), ARES_BULK_CHUNK_SIZE)]
+    responses = await asyncio.gather(*(search_companies_ares(chunk) for chunk in chunks), return_exceptions=True)
+    for chunk, found in zip(chunks, responses):
+        if isinstance(found, RateLimited):
+            logging.warning(f"Hromadné vyhledávání v ARES odloženo: {found}")
+            error = f"ARES rate limit reached, retry in {math.ceil(found.retry_after)} s."
+            results.update({ico: AresCompanyResult(error=error) for ico in chunk})
+            continue
+        if isinstance(found, Exception):
+            logging.error(f"Hromadné vyhledávání v ARES selhalo: {found}")
+            results.update({ico: AresCompanyResult(error="ARES request failed.") for ico in chunk})
+            continue
+
+        await cache.set_many(
+            {f"{ico}{redis_key_suffix}": encode_company(company) for ico, company in found.items()},
+            ttl=ARES_HARD_TTL,
+        )
+        await cache.set_many(
+            {f"{ico}{redis_key_suffix}": negative_entry(ARES_NOT_FOUND) for ico in chunk if ico not in found},
+            ttl=ARES_NEGATIVE_TTL,
+        )
+        for ico in chunk:
+            company = found.get(ico)
+            results[ico] = AresCompanyResult(company=company) if company else AresCompanyResult(error="IČO doesn´t found.")
+
+    # Vyhledávání podle názvu zná každou firmu, kterou API vrátilo
+    if index_names:
+        name_index.add_many((result.company.ico, result.company.name) for result in results.values() if result.company)
+    return results
+
+
 
 def main():
-    something = new_get_company_data_ares("27405354")
+    something = asyncio.run(new_get_company_data_ares("27405354"))
     print(something)
     pass
 
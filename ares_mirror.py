@@ -0,0 +1,267 @@
+import os
+import gzip
+import json
+import time
+import sqlite3
+import logging
+import zipfile
+import argparse
+
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from metrics import cache_lookups
+
+
+logging.basicConfig(
+    format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Bez souboru se zrcadlo nepoužívá a vše jde přes API ARES
+ARES_MIRROR_PATH = os.environ.get("ARES_MIRROR_PATH", "ares_mirror.sqlite3")
+# Jak často workery kontrolují, jestli ingest nenahradil soubor novým
+ARES_MIRROR_CHECK_INTERVAL = float(os.environ.get("ARES_MIRROR_CHECK_INTERVAL", 60))
+INGEST_BATCH_SIZE = 10000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS companies (
+    ico TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def iter_json_records(lines: Iterable[str]) -> Iterator[dict]:
+    """
+    Parse ARES records from JSON lines; a line may also be a page of the
+    bulk search ({"ekonomickeSubjekty": [...]}).
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError as e:
+            logging.warning(f"Skipping an invalid line of the ARES dump: {e}")
+            continue
+        if isinstance(data, dict) and "ekonomickeSubjekty" in data:
+            yield from data["ekonomickeSubjekty"]
+        elif isinstance(data, dict):
+            yield data
+
+
+def iter_dump_records(path: str) -> Iterator[dict]:
+    """
+    Stream ARES records (as returned by the REST API) from a dump.
+
+    Supported are JSONL files, optionally gzip-compressed, and zip archives
+    of .json files (one record or one bulk search page each) or .jsonl files.
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for name in archive.namelist():
+                if not name.lower().endswith((".json", ".jsonl")):
+                    continue
+                with archive.open(name) as member:
+                    lines = (line.decode("utf-8") for line in member)
+                    if name.lower().endswith(".json"):
+                        # Jeden záznam na soubor, může být přes více řádků
+                        lines = iter(["".join(lines).replace("\n", " ")])
+                    yield from iter_json_records(lines)
+        return
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        yield from iter_json_records(file)
+
+
+class AresMirror:
+    """
+    Local read-only copy of ARES in SQLite, built by `python ares_mirror.py ingest`.
+
+    Companies are stored as encoded AresCompany values (ares.company_codec)
+    keyed by IČO, so a lookup is one primary-key read without any network
+    round trip. Ingest builds a new file next to the old one and swaps it in
+    atomically; running workers notice the new file within
+    ARES_MIRROR_CHECK_INTERVAL seconds and reopen it.
+    """
+
+    def __init__(self, path: str = ARES_MIRROR_PATH):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._file_id: Optional[Tuple[int, int]] = None
+        self._last_check: Optional[float] = None
+        self.counters = {"hits": 0, "misses": 0}
+
+    def _current_file_id(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        now = time.monotonic()
+        if self._last_check is not None and now - self._last_check < ARES_MIRROR_CHECK_INTERVAL:
+            return self._db
+        self._last_check = now
+        file_id = self._current_file_id()
+        if file_id != self._file_id:
+            self.close()
+            if file_id is not None:
+                self._db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+                logging.info(f"Opened the ARES mirror {self.path} ({self.metadata().get('records', '?')} companies).")
+            self._file_id = file_id
+        return self._db
+
+    def get(self, ico: str) -> Optional[bytes]:
+        """
+        Returns:
+        bytes|None: Encoded AresCompany, None if the mirror doesn't exist or doesn't know the IČO.
+        """
+        return self.get_many([ico]).get(ico)
+
+    def get_many(self, icos: List[str]) -> Dict[str, bytes]:
+        db = self._connection()
+        if db is None or not icos:
+            return {}
+        found: Dict[str, bytes] = {}
+        # SQLite má omezený počet parametrů v jednom dotazu
+        for start in range(0, len(icos), 500):
+            chunk = icos[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            try:
+                found.update(db.execute(f"SELECT ico, data FROM companies WHERE ico IN ({placeholders})", chunk))
+            except sqlite3.Error as e:
+                logging.error(f"Reading the ARES mirror failed: {e}")
+                return found
+        self.counters["hits"] += len(found)
+        self.counters["misses"] += len(icos) - len(found)
+        cache_lookups.inc("ares_mirror", "hit", amount=len(found))
+        cache_lookups.inc("ares_mirror", "miss", amount=len(icos) - len(found))
+        return found
+
+    def metadata(self) -> Dict[str, str]:
+        if self._db is None:
+            return {}
+        try:
+            return dict(self._db.execute("SELECT key, value FROM meta"))
+        except sqlite3.Error:
+            return {}
+
+    def stats(self) -> Dict[str, object]:
+        self._connection()
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_ratio": round(self.counters["hits"] / lookups, 3) if lookups else 0.0,
+            **self.metadata(),
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+ares_mirror = AresMirror()
+
+
+def ingest(
+    dump_paths: List[str],
+    encode_record: Callable[[dict], Tuple[Optional[str], bytes]],
+    path: str = ARES_MIRROR_PATH,
+) -> int:
+    """
+    Build the mirror from ARES dumps, replacing the existing one at the end.
+
+    Parameters:
+    dump_paths (List[str]): Dumps read by iter_dump_records; later ones win for duplicate IČOs.
+    encode_record (Callable): Turns an ARES record into (IČO, encoded AresCompany).
+    path (str): Mirror file.
+
+    Returns:
+    int: Number of companies in the new mirror.
+    """
+    temp_path = f"{path}.building"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    db = sqlite3.connect(temp_path)
+    try:
+        # Soubor se staví celý znovu, po pádu se začne od začátku
+        db.execute("PRAGMA journal_mode=OFF")
+        db.execute("PRAGMA synchronous=OFF")
+        db.executescript(_SCHEMA)
+        started = time.monotonic()
+        batch: List[Tuple[str, bytes]] = []
+        skipped = 0
+        for dump_path in dump_paths:
+            logging.info(f"Ingesting {dump_path}.")
+            for record in iter_dump_records(dump_path):
+                ico, data = encode_record(record)
+                if not ico:
+                    skipped += 1
+                    continue
+                batch.append((ico, data))
+                if len(batch) >= INGEST_BATCH_SIZE:
+                    db.executemany("INSERT OR REPLACE INTO companies (ico, data) VALUES (?, ?)", batch)
+                    batch.clear()
+        db.executemany("INSERT OR REPLACE INTO companies (ico, data) VALUES (?, ?)", batch)
+        records = db.execute("SELECT COUNT(*) FROM companies").fetchone()[0]
+        db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+            ("records", str(records)),
+            ("ingested_at", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())),
+            ("sources", ", ".join(os.path.basename(dump_path) for dump_path in dump_paths)),
+        ])
+        db.commit()
+        logging.info(f"Ingested {records} companies in {time.monotonic() - started:.1f} s, skipped {skipped} records without IČO.")
+    finally:
+        db.close()
+    os.replace(temp_path, path)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mirror of ARES built from the bulk open-data dumps.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ingest_parser = subparsers.add_parser("ingest", help="Build the mirror from dumps, replacing the current one.")
+    ingest_parser.add_argument("dumps", nargs="+", help="JSONL (.gz) files or zip archives of ARES records.")
+    ingest_parser.add_argument("--path", default=ARES_MIRROR_PATH, help="Mirror file (default: ARES_MIRROR_PATH).")
+    lookup_parser = subparsers.add_parser("lookup", help="Print a company from the mirror.")
+    lookup_parser.add_argument("ico")
+    lookup_parser.add_argument("--path", default=ARES_MIRROR_PATH)
+    subparsers.add_parser("report", help="Print information about the mirror.")
+    args = parser.parse_args()
+
+    from ares import company_codec, parse_ares_record
+    from name_search import name_index
+
+    if args.command == "ingest":
+        ingested_at = time.time()
+        # Názvy se přidají k indexu pro /search, běžící servery nový snapshot načtou samy
+        name_index.load()
+
+        def encode_record(record: dict) -> Tuple[Optional[str], bytes]:
+            company = parse_ares_record(record)
+            if company.ico:
+                company.ico = str(company.ico).zfill(8)
+            name_index.add(company.ico, company.name)
+            return company.ico, company_codec.encode(company, fetched_at=ingested_at)
+
+        print(f"Mirror contains {ingest(args.dumps, encode_record, args.path)} companies.")
+        name_index.save()
+    elif args.command == "lookup":
+        data = AresMirror(args.path).get(args.ico.zfill(8))
+        print(company_codec.decode(data) if data is not None else "Not in the mirror.")
+    else:
+        for name, value in ares_mirror.stats().items():
+            print(f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
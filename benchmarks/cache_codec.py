@@ -0,0 +1,92 @@
+"""
+Compare the old JSON cache values with codec.DataclassCodec.
+
+Reports encode and decode time and bytes per entry for AresCompany
+(with and without the CZ-NACE hierarchy) and vat_new.Company.
+
+Usage: python benchmarks/cache_codec.py [number of runs]
+"""
+import os
+import sys
+import json
+import time
+
+from dataclasses import asdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ares import AresCompany, company_codec as ares_codec  # noqa: E402
+from reference_data import load_reference_data  # noqa: E402
+from vat_new import Company, company_codec as vat_codec  # noqa: E402
+
+
+def sample_entries():
+    company = AresCompany(
+        ico="27405354",
+        name="Example Software s.r.o.",
+        address="Vinohradská 2828/151, Žižkov, 13000 Praha 3",
+        psc="13000",
+        legal_form="Společnost s ručením omezeným",
+        business_fields=["62010", "62020", "62090", "63110", "70220", "73110", "85590"],
+        size="25 - 49 zaměstnanců",
+    )
+    with_hierarchy = AresCompany(**asdict(company))
+    with_hierarchy.main_cz_nace = "62010 - Programování"
+    with_hierarchy.main_cz_nace_hierarchy = list(
+        load_reference_data(
+            os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cznace.csv"),
+            os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pocet_pracovniku.csv"),
+        ).nace_index.resolve("62010")
+    )
+    vat = Company(
+        isValid=True,
+        requestDate="2024-01-01+01:00",
+        name="EXAMPLE SOFTWARE S.R.O.",
+        address="Vinohradská 2828/151 PRAHA 3 130 00",
+        vatNumber="27405354",
+    )
+    return {
+        "AresCompany": (company, ares_codec),
+        "AresCompany + hierarchy": (with_hierarchy, ares_codec),
+        "vat_new.Company": (vat, vat_codec),
+    }
+
+
+def json_encode(obj):
+    # Původní formát: JSON z __dict__ / asdict
+    return json.dumps({"fetched_at": time.time(), "company": asdict(obj)})
+
+
+def json_decode(cls, data):
+    return cls(**json.loads(data)["company"])
+
+
+def timed(function, runs):
+    started = time.perf_counter()
+    for _ in range(runs):
+        function()
+    return (time.perf_counter() - started) / runs * 1e6
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"{'entry':26} {'format':>7} {'bytes':>6} {'encode us':>10} {'decode us':>10}")
+    for name, (obj, codec) in sample_entries().items():
+        encoded_json = json_encode(obj).encode("utf-8")
+        encoded = codec.encode(obj, fetched_at=time.time())
+        if codec.decode(encoded) != obj:
+            raise AssertionError(f"{name} does not round-trip")
+
+        rows = [
+            ("json", encoded_json, lambda: json_encode(obj), lambda: json_decode(type(obj), encoded_json)),
+            ("codec", encoded, lambda: codec.encode(obj, fetched_at=0.0), lambda: codec.decode(encoded)),
+        ]
+        for format_name, data, encode, decode in rows:
+            print(
+                f"{name:26} {format_name:>7} {len(data):>6} "
+                f"{timed(encode, runs):>10.2f} {timed(decode, runs):>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Load test of GET /company with every lookup missing the cache.
+
+Starts a stub of ARES and the ČSÚ register that answers after a fixed
+latency, runs the app under uvicorn with its upstream requests redirected
+to the stub, and sends requests for distinct valid IČOs from a pool of
+concurrent clients. Prints requests per second and latency percentiles.
+Redis is expected on REDIS_HOST_NAME as in production; trees before the
+async rewrite fail every request without it.
+
+The app is imported from --tree, so the same script measures an older
+checkout, e.g. the synchronous request path before the async rewrite:
+
+    git worktree add /tmp/before 1e544ed~1
+    python benchmarks/company_load.py --tree /tmp/before --concurrency 40
+    python benchmarks/company_load.py --concurrency 100
+
+Usage: python benchmarks/company_load.py [--requests N] [--concurrency N] [--latency S] [--tree PATH]
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB_HTML = (
+    "<html><body><div></div><div><div></div><div>"
+    + "<div></div>" * 6
+    + "<div><div>x</div><div>62010 Programování</div></div>"
+    + "</div></div></body></html>"
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def valid_icos(count: int):
+    # Sedmimístný základ + kontrolní číslice, stejně jako verification.verify_ico
+    base = 2000000
+    while count:
+        digits = str(base).zfill(7)
+        weighted_sum = sum(int(digit) * weight for digit, weight in zip(digits, range(8, 1, -1)))
+        yield digits + str((11 - weighted_sum % 11) % 10)
+        base += 1
+        count -= 1
+
+
+def run_stub(port: int, latency: float):
+    async def company(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        ico = request.match_info["ico"]
+        return web.json_response({"zaznamy": [{
+            "ico": ico,
+            "obchodniJmeno": f"Firma {ico} s.r.o.",
+            "sidlo": {"textovaAdresa": "Vinohradská 2828/151, 13000 Praha 3", "psc": 13000},
+            "pravniForma": "112",
+            "czNace": ["62010"],
+            "statistickeUdaje": {},
+        }]})
+
+    async def czso(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        return web.Response(text=STUB_HTML, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/{prefix:.*}/ekonomicke-subjekty-res/{ico}", company)
+    app.router.add_get("/res/detail", czso)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+def run_app(port: int, stub_url: str, tree: str):
+    os.chdir(tree)
+    sys.path.insert(0, tree)
+    import uvicorn
+    import http_client
+
+    # Požadavky na ARES i ČSÚ míří na stub; funguje pro synchronní i asynchronní http_client.get
+    original_get = http_client.get
+
+    def get(upstream, url, **kwargs):
+        parts = urlsplit(url)
+        return original_get(upstream, f"{stub_url}{parts.path}?{parts.query}", **kwargs)
+
+    http_client.get = get
+    import main as app_module
+    uvicorn.run(app_module.app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+
+async def wait_until_up(session: aiohttp.ClientSession, url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(url) as response:
+                await response.read()
+                return
+        except aiohttp.ClientError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def generate_load(app_url: str, requests: int, concurrency: int):
+    icos = iter(list(valid_icos(requests + concurrency)))
+    latencies, statuses = [], {}
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_until_up(session, f"{app_url}/docs")
+
+        async def client(count: int):
+            for _ in range(count):
+                started = time.perf_counter()
+                async with session.get(f"{app_url}/company/{next(icos)}") as response:
+                    await response.read()
+                latencies.append(time.perf_counter() - started)
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+
+        # Zahřátí: otevřená spojení a naplněné pooly, do výsledků se nepočítá
+        await asyncio.gather(*(client(1) for _ in range(concurrency)))
+        latencies.clear()
+        statuses.clear()
+        started = time.perf_counter()
+        per_client = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+        await asyncio.gather(*(client(count) for count in per_client))
+        elapsed = time.perf_counter() - started
+    return elapsed, sorted(latencies), statuses
+
+
+def percentile(values, fraction: float) -> float:
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of GET /company against stubbed upstreams.")
+    parser.add_argument("role", nargs="?", default="load", choices=["load", "stub", "app"], help=argparse.SUPPRESS)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub response time in seconds.")
+    parser.add_argument("--tree", default=ROOT, help="Checkout whose main:app is measured.")
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--stub-url")
+    args = parser.parse_args()
+
+    if args.role == "stub":
+        return run_stub(args.port, args.latency)
+    if args.role == "app":
+        return run_app(args.port, args.stub_url, args.tree)
+
+    stub_port, app_port = free_port(), free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    state_dir = tempfile.mkdtemp(prefix="company-load-")
+    env = {
+        **os.environ,
+        # Limity ARES/ČSÚ a obnova oblíbených záznamů by měření zkreslily
+        "ARES_RATE_LIMIT": "1000000", "ARES_RATE_BURST": "1000000",
+        "CZSO_RATE_LIMIT": "1000000", "CZSO_RATE_BURST": "1000000",
+        "ARES_REFRESH_TOP_N": "0",
+        "NAME_INDEX_SNAPSHOT_INTERVAL": "0",
+        "NAME_INDEX_PATH": os.path.join(state_dir, "name_index.pickle"),
+        "ARES_MIRROR_PATH": os.path.join(state_dir, "ares_mirror.sqlite3"),
+        "LOGO_STORE_DIR": os.path.join(state_dir, "logos"),
+    }
+    script = os.path.abspath(__file__)
+    app_log = open(os.path.join(state_dir, "app.log"), "w")
+    stub = subprocess.Popen(
+        [sys.executable, script, "stub", "--port", str(stub_port), "--latency", str(args.latency)], env=env
+    )
+    app = subprocess.Popen(
+        [sys.executable, script, "app", "--port", str(app_port), "--stub-url", stub_url, "--tree", args.tree],
+        env=env, stderr=app_log,
+    )
+    try:
+        elapsed, latencies, statuses = asyncio.run(
+            generate_load(f"http://127.0.0.1:{app_port}", args.requests, args.concurrency)
+        )
+    finally:
+        app.terminate()
+        stub.terminate()
+        app.wait()
+        stub.wait()
+        app_log.close()
+
+    print(f"tree: {args.tree} (app log: {app_log.name})")
+    print(f"{len(latencies)} requests, {args.concurrency} concurrent, upstream latency {args.latency * 1000:.0f} ms")
+    print(f"status codes: {statuses}")
+    print(f"throughput: {len(latencies) / elapsed:8.1f} req/s")
+    for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        print(f"{name}:        {percentile(latencies, fraction) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compare czso_parse_content (BeautifulSoup) with czso_extract_cz_nace (CzNaceLocator).
+
+Every page in fixtures/czso must give the same result with both parsers,
+then both are timed and their peak allocations measured per page. Besides
+regular pages the fixtures cover broken markup the two could read
+differently: an unclosed <p> before the page body, a <div> in <head>, a
+<script> inside the value and an entity without ';' at its end.
+
+Usage: python benchmarks/czso_parse.py [number of runs]
+"""
+import os
+import sys
+import glob
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from czso import czso_extract_cz_nace, czso_parse_content  # noqa: E402
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "czso")
+PARSERS = {
+    "bs4": czso_parse_content,
+    "fast": czso_extract_cz_nace,
+}
+
+
+def load_fixtures():
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html"))):
+        with open(path, "rb") as file:
+            fixtures[os.path.basename(path)] = file.read()
+    return fixtures
+
+
+def check_fixtures(fixtures):
+    for name, content in fixtures.items():
+        expected = czso_parse_content(content)
+        actual = czso_extract_cz_nace(content)
+        if actual != expected:
+            raise AssertionError(f"{name}: {actual!r} != {expected!r}")
+
+
+def measure(parse, content, runs):
+    started = time.perf_counter()
+    for _ in range(runs):
+        parse(content)
+    elapsed = (time.perf_counter() - started) / runs
+
+    tracemalloc.start()
+    parse(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    fixtures = load_fixtures()
+    check_fixtures(fixtures)
+    print(f"{len(fixtures)} fixtures match, {runs} runs each\n")
+
+    print(f"{'page':32} {'bytes':>7} {'parser':>6} {'ms/page':>9} {'peak KiB':>9}")
+    for name, content in fixtures.items():
+        for parser_name, parse in PARSERS.items():
+            elapsed, peak = measure(parse, content, runs)
+            print(f"{name:32} {len(content):>7} {parser_name:>6} {elapsed * 1000:>9.3f} {peak / 1024:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Measure the per-request cost of the /metrics instrumentation.
+
+Calls a minimal ASGI app directly and wrapped in metrics.MetricsMiddleware,
+and times the metric primitives used on the upstream and Redis paths.
+
+Usage: python benchmarks/metrics_overhead.py [number of runs]
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+
+
+async def bare_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def timed_app(app, runs):
+    scope = {"type": "http", "method": "GET", "path": "/company/27405354"}
+    started = time.perf_counter()
+    for _ in range(runs):
+        await app(scope, receive, send)
+    return (time.perf_counter() - started) / runs * 1e6
+
+
+def timed(function, runs):
+    started = time.perf_counter()
+    for _ in range(runs):
+        function()
+    return (time.perf_counter() - started) / runs * 1e6
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    registry = metrics.Registry()
+    histogram = registry.register(metrics.Histogram("bench_seconds", "Benchmark.", ("upstream",)))
+    counter = registry.register(metrics.Counter("bench_total", "Benchmark.", ("family", "result")))
+
+    bare = asyncio.run(timed_app(bare_app, runs))
+    wrapped = asyncio.run(timed_app(metrics.MetricsMiddleware(bare_app), runs))
+    print(f"{'ASGI call, bare':34} {bare:>8.2f} us")
+    print(f"{'ASGI call, MetricsMiddleware':34} {wrapped:>8.2f} us")
+    print(f"{'middleware overhead':34} {wrapped - bare:>8.2f} us")
+    print(f"{'Histogram.observe':34} {timed(lambda: histogram.observe(0.042, 'ares'), runs):>8.2f} us")
+    print(f"{'Counter.inc':34} {timed(lambda: counter.inc('vat_info', 'l1_hit'), runs):>8.2f} us")
+    print(f"{'key_family':34} {timed(lambda: metrics.key_family('27405354_company_data_test'), runs):>8.2f} us")
+
+
+if __name__ == "__main__":
+    main()
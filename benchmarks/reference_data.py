@@ -0,0 +1,74 @@
+"""
+Compare the old per-lookup pd.read_csv helpers with the ReferenceData registry.
+
+Enriches one record with 20 CZ-NACE codes and a company size category, the
+way new_get_company_data_ares did before (each code is looked up twice, once
+for the isinstance check and once for the value) and the way it does now.
+pandas is no longer in requirements.txt, install it to run the "before" part.
+
+Usage: python benchmarks/reference_data.py [number of runs]
+"""
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pandas as pd  # noqa: E402
+
+from reference_data import load_reference_data  # noqa: E402
+
+CZNACE_PATH = os.path.join(ROOT, "cznace.csv")
+SIZES_PATH = os.path.join(ROOT, "pocet_pracovniku.csv")
+RECORD_CODES = 20
+
+
+def find_cznace_description(key, csv_path: str = CZNACE_PATH):
+    # Původní implementace z ares.py
+    df = pd.read_csv(csv_path, delimiter=';', dtype={'id_cznace': str})
+    description = df.loc[df['id_cznace'] == key, 'text_cznace'].values
+    return description[0] if len(description) > 0 else None
+
+
+def find_company_size(chodnota, csv_path: str = SIZES_PATH):
+    df = pd.read_csv(csv_path, delimiter=',', dtype={'chodnota': str})
+    size_text = df.loc[df['chodnota'] == chodnota, 'zkrtext'].values
+    return size_text[0] if len(size_text) > 0 else None
+
+
+def enrich_before(codes, size_code):
+    descriptions = [find_cznace_description(code) for code in codes if isinstance(find_cznace_description(code), str)]
+    return descriptions, find_company_size(size_code)
+
+
+def enrich_after(reference_data, codes, size_code):
+    return reference_data.describe_many(codes), reference_data.company_size(size_code)
+
+
+def timed(function, runs):
+    started = time.perf_counter()
+    for _ in range(runs):
+        function()
+    return (time.perf_counter() - started) / runs
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    reference_data = load_reference_data(CZNACE_PATH, SIZES_PATH)
+    codes = list(reference_data.cznace)[-RECORD_CODES:]
+    size_code = next(iter(reference_data.company_sizes))
+
+    if enrich_before(codes, size_code) != enrich_after(reference_data, codes, size_code):
+        raise AssertionError("The registry returns different values than the pandas lookups")
+
+    before = timed(lambda: enrich_before(codes, size_code), runs)
+    after = timed(lambda: enrich_after(reference_data, codes, size_code), runs * 10000)
+    print(f"record with {len(codes)} CZ-NACE codes + size category")
+    print(f"before (pd.read_csv per lookup): {before * 1e3:10.1f} ms")
+    print(f"after  (ReferenceData):          {after * 1e6:10.1f} us")
+    print(f"speedup:                         {before / after:10.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,25 @@
 import os
-import requests
+import asyncio
 import logging
 import json
-import glob
-import cairosvg
+import zlib
+import hashlib
+import sqlite3
+import tempfile
 
 from typing import Dict, Optional
+from urllib.parse import urlsplit
 
 import importlib
 
+import http_client
+
+from fastapi.concurrency import run_in_threadpool
+
+from cache import cache, negative_entry, parse_negative_entry
+from helper import get_better_formated_domain
+from logo_store import ACCESS_WRITE_INTERVAL, IMAGE_EXTENSIONS, LogoEntry, logo_store
+
 # check if the module exists
 spec = importlib.util.find_spec("conf")
 if spec is not None:
@@ -25,17 +36,52 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 
-def get_company_data_from_brandfetch_by_domain(company_domain:str) -> Dict:
+# Jak dlouho se pamatuje, že doména nemá použitelné logo
+LOGO_NEGATIVE_TTL = int(os.environ.get("LOGO_NEGATIVE_TTL", 24 * 60 * 60))
+LOGO_MISSING = "logo-missing"
+# Jak dlouho se drží data značky z Brandfetche
+BRANDFETCH_TTL = int(os.environ.get("BRANDFETCH_TTL", 7 * 24 * 60 * 60))
+BRANDFETCH_NEGATIVE_TTL = int(os.environ.get("BRANDFETCH_NEGATIVE_TTL", 24 * 60 * 60))
+BRANDFETCH_UNKNOWN = "brandfetch-unknown"
+# Největší povolená velikost loga a kontrola obsahu podle prvních bajtů
+LOGO_MAX_BYTES = int(os.environ.get("LOGO_MAX_BYTES", 5 * 1024 * 1024))
+LOGO_SNIFF = os.environ.get("LOGO_SNIFF", "1") != "0"
+
+
+async def get_company_data_from_brandfetch_by_domain(company_domain:str) -> Dict:
     """
     Get company data from Brandfetch API by given domain.
 
+    Answers are cached for BRANDFETCH_TTL under the domain normalized by
+    get_better_formated_domain, unknown domains for BRANDFETCH_NEGATIVE_TTL.
+
     Parameters:
     company_domain (str): Domain of the company.
 
     Returns:
-    dict|None: Return dictionary with company data if the request is successful, None otherwise.
+    dict|None: Return dictionary with company data if the request is successful,
+    empty dictionary if Brandfetch doesn't know the domain, None otherwise.
     """
-    company_domain = company_domain.strip()
+    company_domain = get_better_formated_domain(company_domain.strip())
+    redis_key = f"brandfetch_brand:{company_domain}"
+    cached_data = await cache.get(redis_key)
+    if cached_data is not None:
+        brandfetch_cache_counters["hits"] += 1
+        return decode_brand(cached_data)
+
+    brandfetch_cache_counters["misses"] += 1
+    return await cache.coalesce(
+        redis_key, lambda: fetch_company_data_from_brandfetch(company_domain, redis_key), decode_brand
+    )
+
+
+def decode_brand(cached_data: bytes) -> Dict:
+    if parse_negative_entry(cached_data) is not None:
+        return {}
+    return json.loads(zlib.decompress(cached_data))
+
+
+async def fetch_company_data_from_brandfetch(company_domain: str, redis_key: str) -> Optional[Dict]:
     url = f"https://api.brandfetch.io/v2/brands/{company_domain}"
     API_TOKEN = os.environ.get("BRAND_FETCH_TOKEN", BRAND_FETCH_TOKEN)
 
@@ -44,25 +90,35 @@ def get_company_data_from_brandfetch_by_domain(company_domain:str) -> Dict:
         "Authorization": f"Bearer {API_TOKEN}"
     }
     try:
-        response = requests.get(url, headers=headers)
+        response = await http_client.get("brandfetch", url, headers=headers)
         response.raise_for_status()  
 
         # Try to convert the response to JSON
         json_response = response.json()
         logging.info(f"Request for company domain {company_domain} is OK!")
+        # Odpovědi Brandfetche mají desítky kB, do cache jdou komprimované
+        await cache.set(redis_key, zlib.compress(response.content), ttl=BRANDFETCH_TTL)
         return json_response
 
-    except requests.exceptions.HTTPError as err:
+    except http_client.HttpStatusError as err:
         logging.error(f"HTTP error occurred: {err}")
-
-    except requests.exceptions.ConnectionError as err:
-        logging.error(f"Connection error occurred: {err}")
+        if err.status_code == 404:
+            await cache.set(redis_key, negative_entry(BRANDFETCH_UNKNOWN), ttl=BRANDFETCH_NEGATIVE_TTL)
+            return {}
 
     except json.JSONDecodeError:
         logging.error("Failed to parse response to JSON.")
 
-    except requests.exceptions.RequestException as err:
-        logging.error(f"Other requests exception occurred: {err}")
+    except http_client.HttpError as err:
+        logging.error(f"Connection error occurred: {err}")
+
+
+def brandfetch_cache_stats() -> Dict[str, float]:
+    lookups = brandfetch_cache_counters["hits"] + brandfetch_cache_counters["misses"]
+    return {
+        **brandfetch_cache_counters,
+        "hit_ratio": round(brandfetch_cache_counters["hits"] / lookups, 3) if lookups else 0.0,
+    }
 
 
 def get_logo_src(company_data:dict, logo_type:str ='logo'):
@@ -79,109 +135,230 @@ def get_logo_src(company_data:dict, logo_type:str ='logo'):
 
     if company_data is not None:
         try:
-            for logo in company_data['logos']:
+            for logo in company_data.get('logos', []):
                 if logo['type'] == logo_type:
                     for format in logo['formats']:
                         return format['src']
-        except TypeError as err:
+        except (TypeError, AttributeError) as err:
             logging.error(f"The company with this domain doesnt exist: {err}")
 
     return None
 
 
-def is_url_image(url:str) -> bool:
+class LogoRejected(Exception):
+    """The logo URL answered, but not with a usable image."""
+
+
+# Začátky souborů podporovaných formátů, pro kontrolu prvního bloku dat
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+    (b"BM", ".bmp"),
+    (b"II*\x00", ".tiff"),
+    (b"MM\x00*", ".tiff"),
+)
+SNIFF_BYTES = 1024
+
+_downloads: Dict[str, asyncio.Task] = {}
+# Uvolňování místa v úložišti log běží na pozadí, nejvýš jedno najednou
+_eviction: Optional[asyncio.Task] = None
+_eviction_requested = False
+brandfetch_cache_counters = {"hits": 0, "misses": 0}
+
+
+def sniff_image_type(first_chunk: bytes) -> Optional[str]:
     """
-    Check if the url is an image.
+    Guess the image format from the first bytes of a file.
 
     Parameters:
-    url (str): URL to check.
+    first_chunk (bytes): Beginning of the downloaded data.
 
     Returns:
-    bool: Return True if the URL points to an image, False otherwise.
+    str|None: File extension of the detected format, None if it isn't a supported image.
     """
+    for signature, extension in IMAGE_SIGNATURES:
+        if first_chunk.startswith(signature):
+            return extension
+    head = first_chunk[:SNIFF_BYTES].lstrip(b"\xef\xbb\xbf \t\r\n").lower()
+    if head.startswith((b"<svg", b"<?xml", b"<!--", b"<!doctype svg")) and b"<svg" in head:
+        return ".svg"
+    return None
 
-    try:
-        response = requests.get(url)
-        response.raise_for_status()  
-        content_type = response.headers.get('content-type')
-        
-        if 'image' in content_type.lower():
-            return True
-        else:
-            logging.error(f"URL is not an image: {url}")
-            return False
-
-    except requests.exceptions.RequestException as err:
-        logging.error(f"Request exception occurred: {err}")
-        return False
+
+def check_image_head(url: str, head: bytes) -> Optional[str]:
+    if not head:
+        raise LogoRejected(f"Empty response: {url}")
+    extension = sniff_image_type(head)
+    if LOGO_SNIFF and extension is None:
+        raise LogoRejected(f"Content of {url} is not a supported image.")
+    return extension
+
+
+def logo_extension(url: str, sniffed_extension: Optional[str]) -> Optional[str]:
+    # Přípona z cesty v URL bez query stringu, jinak podle obsahu
+    extension = os.path.splitext(urlsplit(url).path)[1].lower()
+    return extension if extension in IMAGE_EXTENSIONS else sniffed_extension
 
 
-def download_image(url:str):
+async def download_logo(url: str, domain: str) -> Optional[LogoEntry]:
     """
-    Download an image from the given URL.
+    Download a logo in a single streaming request and put it into the logo store.
+
+    The content type and (unless LOGO_SNIFF is off) the magic bytes of the
+    first SNIFF_BYTES are checked before anything is written, and the
+    download stops after LOGO_MAX_BYTES. Data are hashed while they are
+    written to a temporary file, which is then moved into the store, so
+    other requests never see a partial file.
 
     Parameters:
-    url (str): URL of the image to download.
+    url (str): URL of the logo.
+    domain (str): Domain the logo belongs to.
 
     Returns:
-    bytes|None: Return the image data if the request is successful, None otherwise.
-    """
+    LogoEntry|None: Stored logo, None if the download failed.
 
+    Raises:
+    LogoRejected: When the URL doesn't point to an image or the image is too large.
+    """
+    os.makedirs(logo_store.temp_dir, exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(prefix="download-", dir=logo_store.temp_dir)
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        return response.content
-    except requests.exceptions.RequestException as err:
+        with os.fdopen(descriptor, 'wb') as file:
+            async with http_client.stream("GET", "logo", url) as response:
+                response.raise_for_status()
+                content_type = response.headers.get('content-type', '')
+                if 'image' not in content_type.lower():
+                    raise LogoRejected(f"URL is not an image ({content_type}): {url}")
+                content_length = int(response.headers.get('content-length') or 0)
+                if content_length > LOGO_MAX_BYTES:
+                    raise LogoRejected(f"Image has {content_length} bytes, limit is {LOGO_MAX_BYTES}: {url}")
+
+                # Začátek souboru se drží v paměti, dokud nestačí na rozpoznání formátu
+                head = b""
+                sniffed_extension = None
+                size = 0
+                digest = hashlib.sha256()
+                async for chunk in response.iter_chunks():
+                    size += len(chunk)
+                    if size > LOGO_MAX_BYTES:
+                        raise LogoRejected(f"Image is larger than {LOGO_MAX_BYTES} bytes: {url}")
+                    if len(head) < SNIFF_BYTES:
+                        head += chunk
+                        if len(head) >= SNIFF_BYTES:
+                            sniffed_extension = check_image_head(url, head)
+                    file.write(chunk)
+                    digest.update(chunk)
+
+        if len(head) < SNIFF_BYTES:
+            sniffed_extension = check_image_head(url, head)
+        extension = logo_extension(url, sniffed_extension)
+        if extension is None:
+            raise LogoRejected(f"Unknown image format: {url}")
+
+        entry = await run_in_threadpool(logo_store.put, domain, temp_path, extension, digest.hexdigest())
+        logging.info(f"Image was saved: {entry.path}")
+        schedule_logo_eviction()
+        return entry
+
+    except http_client.HttpError as err:
         logging.error(f"Request exception occurred: {err}")
         return None
+    except OSError as err:
+        logging.error(f"Saving logo from {url} failed: {err}")
+        return None
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
 
 
-def save_image(data:bytes, file_path:str):
+async def get_logo(domain:str) -> Optional[LogoEntry]:
     """
-    Save image data to a file.
+    Get logo.
 
     Parameters:
-    data (bytes): Image data to save.
-    file_path (str): Path where the image will be saved.
+    domain (str): Domain in string without http:// or https:// 
+
+    Returns:
+    LogoEntry|None: Logo from the logo store, downloaded first if needed.
     """
+    entry = logo_store.cached(domain)
+    if entry is None:
+        # Dotaz do indexu úložiště (logo mohl uložit jiný worker) neblokuje smyčku událostí
+        entry = await run_in_threadpool(logo_store.get, domain)
+    if entry is not None:
+        return entry
+
+    no_logo_key = f"brandfetch_no_logo:{domain}"
+    if await cache.get(no_logo_key) is not None:
+        logging.info(f"Domain {domain} has no logo (negative cache). Skipping download.")
+        return None
 
-    with open(file_path, 'wb') as file:
-        file.write(data)
-    logging.info(f"Image was saved: {file_path}")
+    # Souběžné požadavky na stejnou doménu počkají na jedno stažení
+    task = _downloads.get(domain)
+    if task is None:
+        task = asyncio.ensure_future(fetch_logo(domain, no_logo_key))
+        _downloads[domain] = task
+        task.add_done_callback(lambda _: _downloads.pop(domain, None))
+    return await asyncio.shield(task)
 
 
-def get_logo(domain:str):
-    """
-    Get logo.
+async def fetch_logo(domain: str, no_logo_key: str) -> Optional[LogoEntry]:
+    response = await get_company_data_from_brandfetch_by_domain(domain)
+    if response is None:
+        # Brandfetch nebyl dostupný, výsledek se neukládá
+        return None
+    url = get_logo_src(response)
+    try:
+        if url is None:
+            raise LogoRejected(f"Brandfetch has no logo for {domain}.")
+        return await download_logo(url, domain)
+    except LogoRejected as err:
+        logging.error(err)
+        await cache.set(no_logo_key, negative_entry(LOGO_MISSING), ttl=LOGO_NEGATIVE_TTL)
+        return None
 
-    Parameters:
-    domain (str): Domain in string without http:// or https:// 
+
+def schedule_logo_eviction():
+    """
+    Enforce the logo store budget in a background thread, so the request
+    that stored a logo doesn't wait for the eviction.
     """
-    directory = os.path.join(os.getcwd(), "logos", domain)  # get current working directory and domain as folder
+    global _eviction, _eviction_requested
+    _eviction_requested = True
+    if _eviction is None or _eviction.done():
+        _eviction = asyncio.ensure_future(evict_logos())
 
-    if os.path.exists(directory):
-        logging.info(f"Directory '{directory}' already exists. Skipping download.")
-        return
 
-    response = get_company_data_from_brandfetch_by_domain(domain)
-    url = get_logo_src(response)
-    if is_url_image(url):
-        image_data = download_image(url)
-        if image_data is not None:
-            os.makedirs(directory, exist_ok=True)
-            filename = url.split("/")[-1]
-            file_path = os.path.join(directory, filename)
-            save_image(image_data, file_path)
+async def evict_logos():
+    global _eviction_requested
+    # Loga uložená během běžícího uvolňování si vyžádají další průchod
+    while _eviction_requested:
+        _eviction_requested = False
+        try:
+            await run_in_threadpool(logo_store.evict)
+        except (OSError, sqlite3.Error) as e:
+            logging.error(f"Logo store eviction failed: {e}")
 
-def get_logo_path(domain):
-    files = glob.glob(f"logos/{domain}/*")
-    img_files = [f for f in files if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.svg'))]
 
-    if img_files:
-        return img_files[0]
+async def run_logo_store_maintenance(interval: float = ACCESS_WRITE_INTERVAL):
+    """
+    Write batched access times and counters of the logo store every `interval` seconds.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        await run_in_threadpool(logo_store.flush)
+
+
+def get_logo_path(domain):
+    entry = logo_store.get(domain)
+    if entry is not None:
+        return entry.path
     logging.info(f"No image file with domain {domain} found.")
     return None
 
+
 def get_media_type(file_path: str) -> Optional[str]:
     extension = os.path.splitext(file_path)[1].lower()
     media_types = {
@@ -196,11 +373,6 @@ def get_media_type(file_path: str) -> Optional[str]:
     return media_types.get(extension)
 
 
-def convert_svg_to_png(file_path: str) -> str:
-    png_file_path = os.path.splitext(file_path)[0] + '.png'
-    cairosvg.svg2png(url=file_path, write_to=png_file_path)
-    return png_file_path
-
 def main():
     pass
 
@@ -0,0 +1,312 @@
+import io
+import os
+import csv
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from itertools import islice
+from typing import Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import http_client
+
+from ares import ARES_BULK_CHUNK_SIZE, get_companies_data_ares
+from cache import cache
+from czso import czso_apply_cz_nace, czso_get_cz_nace
+from ratelimit import limiter
+from reference_data import load_reference_data
+from verification import verify_ico
+
+
+logging.basicConfig(
+    format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Dávka = jeden hromadný dotaz na ARES
+BULK_BATCH_SIZE = ARES_BULK_CHUNK_SIZE
+BULK_CONCURRENCY = int(os.environ.get("BULK_CONCURRENCY", 4))
+# Noční úlohy smí na token do limitu ARES/ČSÚ čekat déle než API
+BULK_RATE_LIMIT_MAX_WAIT = float(os.environ.get("BULK_RATE_LIMIT_MAX_WAIT", 60))
+BULK_REPORT_INTERVAL = float(os.environ.get("BULK_REPORT_INTERVAL", 10))
+
+
+def read_csv_icos(file, column: Optional[str]) -> Iterator[str]:
+    reader = csv.reader(file)
+    first_row = next(reader, None)
+    if first_row is None:
+        return
+    index = 0
+    if column is not None:
+        if column not in first_row:
+            raise ValueError(f"Column {column!r} not found in the CSV header.")
+        index = first_row.index(column)
+    elif first_row and first_row[0].strip().isdigit():
+        # Soubor bez hlavičky, první řádek je už IČO
+        yield first_row[0]
+    for row in reader:
+        yield row[index] if len(row) > index else ""
+
+
+def read_jsonl_icos(file, column: Optional[str]) -> Iterator[str]:
+    for line in file:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            yield ""
+            continue
+        yield str(record.get(column or "ico", "")) if isinstance(record, dict) else str(record)
+
+
+def read_icos(path: str, input_format: Optional[str] = None, column: Optional[str] = None) -> Iterator[str]:
+    """
+    Stream IČOs from a CSV or JSONL file, one value per input record.
+
+    Parameters:
+    path (str): Input file, "-" for standard input.
+    input_format (str|None): "csv" or "jsonl", guessed from the extension when None.
+    column (str|None): CSV column or JSON field with the IČO; defaults to the first column / "ico".
+    """
+    if input_format is None:
+        input_format = "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+    reader = read_jsonl_icos if input_format == "jsonl" else read_csv_icos
+    # utf-8-sig: CSV z Excelu začíná BOM, který by jinak byl součástí prvního IČO nebo názvu sloupce
+    if path == "-":
+        yield from reader(io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8-sig", newline=""), column)
+        return
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        yield from reader(file, column)
+
+
+def batched(items: Iterable[str], size: int) -> Iterator[List[str]]:
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+@dataclass
+class Checkpoint:
+    """
+    Progress of a run: number of input records whose results are in the output and the output size.
+
+    On resume, the output is truncated to `output_offset` (dropping lines of
+    batches that were written after the last checkpoint) and the first
+    `records` input records are skipped.
+    """
+
+    path: str
+    records: int = 0
+    output_offset: int = 0
+    stats: Dict[str, int] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, path: str) -> "Checkpoint":
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+        return cls(path, data["records"], data["output_offset"], data.get("stats", {}))
+
+    def save(self):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"records": self.records, "output_offset": self.output_offset, "stats": self.stats}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.path)
+
+
+class Progress:
+    """
+    Counts results and reports throughput and cache hit rate of this run.
+    """
+
+    def __init__(self, initial: Dict[str, int], interval: float = BULK_REPORT_INTERVAL):
+        self.counters = {"records": 0, "found": 0, "not_found": 0, "invalid": 0, "errors": 0, "czso_failed": 0}
+        self.counters.update(initial)
+        self.interval = interval
+        self.started = time.monotonic()
+        self.started_records = self.counters["records"]
+        self.last_report = self.started
+        self.cache_start = dict(cache.counters)
+
+    def cache_hit_rate(self) -> float:
+        hits = sum(cache.counters[name] - self.cache_start.get(name, 0) for name in ("l1_hits", "l2_hits"))
+        misses = cache.counters["l2_misses"] - self.cache_start.get("l2_misses", 0)
+        return hits / (hits + misses) if hits + misses else 0.0
+
+    def report(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        elapsed = max(now - self.started, 1e-9)
+        rate = (self.counters["records"] - self.started_records) / elapsed
+        print(
+            f"{self.counters['records']} records ({rate:.1f}/s), found {self.counters['found']}, "
+            f"not found {self.counters['not_found']}, invalid {self.counters['invalid']}, "
+            f"errors {self.counters['errors']}, ČSÚ failed {self.counters['czso_failed']}, "
+            f"cache hit rate {self.cache_hit_rate():.1%}",
+            file=sys.stderr,
+        )
+
+
+async def enrich_batch(raw_icos: List[str], semaphore: asyncio.Semaphore, with_czso: bool) -> Tuple[List[dict], Dict[str, int]]:
+    """
+    Look up one batch of IČOs in ARES (cache first, then the bulk search) and ČSÚ.
+
+    Returns:
+    tuple: (output records in input order, counters of the batch).
+    """
+    counters = {"records": len(raw_icos), "found": 0, "not_found": 0, "invalid": 0, "errors": 0, "czso_failed": 0}
+    valid = {}
+    for raw_ico in raw_icos:
+        ico = raw_ico.strip()
+        if ico and verify_ico(ico):
+            valid[raw_ico] = ico.zfill(8)
+
+    async with semaphore:
+        results = await get_companies_data_ares(valid.values(), index_names=False)
+
+    async def add_cz_nace(company):
+        async with semaphore:
+            try:
+                czso_apply_cz_nace(company, await czso_get_cz_nace(company.ico))
+            except Exception as e:
+                logging.warning(f"ČSÚ lookup failed for IČO {company.ico}: {e}")
+                counters["czso_failed"] += 1
+
+    companies = {result.company.ico: result.company for result in results.values() if result.company is not None}
+    if with_czso:
+        await asyncio.gather(*(add_cz_nace(company) for company in companies.values()))
+
+    records = []
+    for raw_ico in raw_icos:
+        ico = valid.get(raw_ico)
+        if ico is None:
+            counters["invalid"] += 1
+            records.append({"input": raw_ico, "error": "Invalid ICO"})
+            continue
+        result = results[ico]
+        if result.company is not None:
+            counters["found"] += 1
+            records.append({"input": raw_ico, "company": asdict(result.company)})
+        else:
+            counters["not_found" if result.error == "IČO doesn´t found." else "errors"] += 1
+            records.append({"input": raw_ico, "error": result.error})
+    return records, counters
+
+
+async def run(
+    input_path: str,
+    output_path: str,
+    checkpoint_path: str,
+    input_format: Optional[str] = None,
+    column: Optional[str] = None,
+    concurrency: int = BULK_CONCURRENCY,
+    batch_size: int = BULK_BATCH_SIZE,
+    with_czso: bool = True,
+    restart: bool = False,
+) -> Dict[str, int]:
+    """
+    Enrich every IČO of the input and append one JSON line per input record to the output.
+
+    Up to `concurrency` batches are looked up at once; results are written
+    in input order, so the checkpoint always describes a complete prefix
+    of the input.
+
+    Returns:
+    dict: Counters of the whole run, including earlier resumed runs.
+    """
+    checkpoint = Checkpoint(checkpoint_path) if restart else Checkpoint.load(checkpoint_path)
+    if checkpoint.records:
+        print(f"Resuming after {checkpoint.records} records.", file=sys.stderr)
+    progress = Progress(checkpoint.stats)
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter.max_wait = BULK_RATE_LIMIT_MAX_WAIT
+
+    mode = "r+b" if checkpoint.output_offset and os.path.exists(output_path) else "wb"
+    with open(output_path, mode) as output:
+        output.seek(checkpoint.output_offset)
+        output.truncate()
+
+        batches = batched(islice(read_icos(input_path, input_format, column), checkpoint.records, None), batch_size)
+        pending: Deque[asyncio.Task] = deque()
+        while True:
+            while len(pending) < concurrency:
+                batch = next(batches, None)
+                if batch is None:
+                    break
+                pending.append(asyncio.ensure_future(enrich_batch(batch, semaphore, with_czso)))
+            if not pending:
+                break
+
+            # Zapisuje se v pořadí vstupu, další dávky mezitím běží
+            records, counters = await pending.popleft()
+            output.write(b"".join(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n" for record in records))
+            output.flush()
+            for name, value in counters.items():
+                progress.counters[name] = progress.counters.get(name, 0) + value
+
+            checkpoint.records = progress.counters["records"]
+            checkpoint.output_offset = output.tell()
+            checkpoint.stats = progress.counters
+            checkpoint.save()
+            progress.report()
+
+    progress.report(force=True)
+    return progress.counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enrich a CSV or JSONL file of IČOs with ARES and ČSÚ data, writing JSONL.")
+    parser.add_argument("input", help="CSV or JSONL file with IČOs, - for standard input.")
+    parser.add_argument("output", help="JSONL output, one line per input record.")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Input format, guessed from the extension by default.")
+    parser.add_argument("--column", help="CSV column or JSON field with the IČO (default: first column / \"ico\").")
+    parser.add_argument("--concurrency", type=int, default=BULK_CONCURRENCY, help="Batches and ČSÚ lookups in flight.")
+    parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE, help="IČOs per ARES bulk search.")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint).")
+    parser.add_argument("--no-czso", action="store_true", help="Skip the ČSÚ lookup of the main CZ-NACE.")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint and start over.")
+    parser.add_argument("--verbose", action="store_true", help="Log every lookup.")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    load_reference_data()
+
+    async def enrich():
+        try:
+            return await run(
+                args.input,
+                args.output,
+                args.checkpoint or f"{args.output}.checkpoint",
+                input_format=args.format,
+                column=args.column,
+                concurrency=args.concurrency,
+                batch_size=args.batch_size,
+                with_czso=not args.no_czso,
+                restart=args.restart,
+            )
+        finally:
+            await http_client.aclose()
+            await cache.aclose()
+
+    asyncio.run(enrich())
+
+
+if __name__ == "__main__":
+    main()
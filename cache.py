@@ -0,0 +1,422 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import redis.asyncio as redis
+
+from redis.asyncio.retry import Retry
+from redis.backoff import NoBackoff
+
+from collections import Counter, OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar, Union
+
+from circuit_breaker import CircuitBreaker
+from metrics import cache_lookups, key_family, redis_command_duration, redis_errors
+
+
+logging.basicConfig(
+    format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+redis_host_name = os.environ.get("REDIS_HOST_NAME", "localhost")
+
+# Velikost a maximální stáří lokální (L1) cache v procesu
+L1_MAX_ENTRIES = int(os.environ.get("CACHE_L1_MAX_ENTRIES", 10000))
+L1_TTL = float(os.environ.get("CACHE_L1_TTL", 60))
+REDIS_SOCKET_TIMEOUT = float(os.environ.get("REDIS_SOCKET_TIMEOUT", 0.5))
+# Jak dlouho smí jeden worker držet zámek na stažení klíče, než ho převezme jiný
+LEASE_SECONDS = float(os.environ.get("CACHE_LEASE_SECONDS", 5))
+LEASE_POLL_INTERVAL = 0.05
+
+CacheValue = Union[bytes, str]
+T = TypeVar("T")
+
+# Smaže zámek jen tehdy, pokud ho stále drží ten, kdo ho získal
+_RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+# Negativní výsledky (neexistující IČO, neplatné DIČ, doména bez loga) se ukládají
+# s tímto prefixem, který nemůže začínat žádný JSON ani jiný běžný záznam
+NEGATIVE_PREFIX = b"\x00neg:"
+
+
+def _to_bytes(value: CacheValue) -> bytes:
+    return value.encode("utf-8") if isinstance(value, str) else value
+
+
+def negative_entry(kind: str, payload: CacheValue = b"") -> bytes:
+    """
+    Encode a negative lookup result.
+
+    Parameters:
+    kind (str): Sentinel name of the lookup path, e.g. "ares-not-found".
+    payload (bytes|str): Optional data needed to answer from the cache.
+    """
+    return NEGATIVE_PREFIX + kind.encode("utf-8") + b":" + _to_bytes(payload)
+
+
+def parse_negative_entry(value: Optional[bytes]) -> Optional[Tuple[str, bytes]]:
+    """
+    Returns:
+    tuple|None: (kind, payload) for a negative entry, None for anything else.
+    """
+    if value is None or not value.startswith(NEGATIVE_PREFIX):
+        return None
+    kind, _, payload = value[len(NEGATIVE_PREFIX):].partition(b":")
+    return kind.decode("utf-8"), payload
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU cache with a per-entry expiry.
+    """
+
+    def __init__(self, max_entries: int, default_ttl: float):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None):
+        ttl = self.default_ttl if ttl is None else min(ttl, self.default_ttl)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+
+class HotKeyTracker:
+    """
+    Access counts and last fetch times of keys, used to find the hottest ones.
+
+    Counts are halved by `decay()`, so the ranking follows recent traffic;
+    at most `max_keys` keys are tracked.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self.hits: Counter = Counter()
+        self.fetched_at: Dict[str, float] = {}
+
+    def touch(self, key: str, fetched_at: float):
+        self.hits[key] += 1
+        self.fetched_at[key] = fetched_at
+        if len(self.hits) > self.max_keys:
+            self.decay()
+
+    def mark_fetched(self, key: str, fetched_at: float):
+        if key in self.fetched_at:
+            self.fetched_at[key] = fetched_at
+
+    def hottest(self, n: int) -> List[Tuple[str, float]]:
+        return [(key, self.fetched_at[key]) for key, _ in self.hits.most_common(n)]
+
+    def decay(self):
+        self.hits = Counter({key: count // 2 for key, count in self.hits.items() if count > 1})
+        if len(self.hits) > self.max_keys:
+            self.hits = Counter(dict(self.hits.most_common(self.max_keys // 2)))
+        self.fetched_at = {key: self.fetched_at[key] for key in self.hits}
+
+
+class TwoTierCache:
+    """
+    In-process LRU (L1) in front of Redis (L2).
+
+    Redis errors never reach the caller: a failed read is a miss, a failed
+    write is skipped. After repeated errors a circuit breaker stops talking
+    to Redis for a while and the cache keeps serving from L1 only.
+    """
+
+    def __init__(self, redis_client: Optional[redis.Redis], local_cache: LocalCache, breaker: CircuitBreaker):
+        self.redis = redis_client
+        self.local = local_cache
+        self.breaker = breaker
+        self.counters = {
+            "l1_hits": 0,
+            "l1_misses": 0,
+            "l2_hits": 0,
+            "l2_misses": 0,
+            "l2_errors": 0,
+            "l2_skipped": 0,
+            "coalesced_local": 0,
+            "coalesced_remote": 0,
+            "negative_hits": 0,
+        }
+        self._in_flight: Dict[str, asyncio.Task] = {}
+
+    async def _call_redis(self, operation: str, *args, **kwargs):
+        """
+        Run a Redis command through the circuit breaker.
+
+        Returns:
+        tuple: (True, result) on success, (False, None) when Redis was skipped or failed.
+        """
+        if self.redis is None or not self.breaker.allow_request():
+            self.counters["l2_skipped"] += 1
+            return False, None
+        started = time.perf_counter()
+        try:
+            result = await getattr(self.redis, operation)(*args, **kwargs)
+        except (redis.RedisError, OSError, asyncio.TimeoutError) as e:
+            self.counters["l2_errors"] += 1
+            redis_errors.inc(operation)
+            self.breaker.record_failure()
+            logging.error(f"Redis {operation} failed: {e}")
+            return False, None
+        finally:
+            redis_command_duration.observe(time.perf_counter() - started, operation)
+        self.breaker.record_success()
+        return True, result
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = self.local.get(key)
+        if value is not None:
+            self.counters["l1_hits"] += 1
+            cache_lookups.inc(key_family(key), "l1_hit")
+        else:
+            self.counters["l1_misses"] += 1
+            ok, value = await self._call_redis("get", key)
+            if not ok or value is None:
+                if ok:
+                    self.counters["l2_misses"] += 1
+                cache_lookups.inc(key_family(key), "miss")
+                return None
+            self.counters["l2_hits"] += 1
+            cache_lookups.inc(key_family(key), "l2_hit")
+            self.local.set(key, value)
+
+        if value.startswith(NEGATIVE_PREFIX):
+            self.counters["negative_hits"] += 1
+        return value
+
+    async def mget(self, keys: List[str], local: bool = True) -> List[Optional[bytes]]:
+        """
+        Get many keys, those missing in L1 with one MGET.
+
+        Parameters:
+        keys (List[str]): Cache keys.
+        local (bool): False skips L1 and reads Redis, e.g. to see what other workers stored.
+        """
+        values = [self.local.get(key) if local else None for key in keys]
+        missing = [key for key, value in zip(keys, values) if value is None]
+        family = key_family(keys[0]) if keys else "other"
+        if local:
+            self.counters["l1_hits"] += len(keys) - len(missing)
+            self.counters["l1_misses"] += len(missing)
+            cache_lookups.inc(family, "l1_hit", amount=len(keys) - len(missing))
+
+        if missing:
+            ok, redis_values = await self._call_redis("mget", missing)
+            found = {}
+            for key, value in zip(missing, redis_values if ok else []):
+                if value is None:
+                    self.counters["l2_misses"] += 1
+                    continue
+                self.counters["l2_hits"] += 1
+                self.local.set(key, value)
+                found[key] = value
+            values = [value if value is not None else found.get(key) for key, value in zip(keys, values)]
+            cache_lookups.inc(family, "l2_hit", amount=len(found))
+            cache_lookups.inc(family, "miss", amount=len(missing) - len(found))
+
+        self.counters["negative_hits"] += sum(1 for value in values if value and value.startswith(NEGATIVE_PREFIX))
+        return values
+
+    async def set(self, key: str, value: CacheValue, ttl: int, local: bool = True):
+        value = _to_bytes(value)
+        # Velké a zřídka čtené hodnoty (např. ladicí HTML) se do L1 neukládají
+        if local:
+            self.local.set(key, value, ttl)
+        await self._call_redis("set", key, value, ex=ttl)
+
+    async def set_many(self, items: Dict[str, CacheValue], ttl: int):
+        if not items:
+            return
+        for key, value in items.items():
+            self.local.set(key, _to_bytes(value), ttl)
+        if self.redis is None or not self.breaker.allow_request():
+            self.counters["l2_skipped"] += 1
+            return
+        started = time.perf_counter()
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for key, value in items.items():
+                    pipe.set(key, _to_bytes(value), ex=ttl)
+                await pipe.execute()
+        except (redis.RedisError, OSError, asyncio.TimeoutError) as e:
+            self.counters["l2_errors"] += 1
+            redis_errors.inc("pipeline")
+            self.breaker.record_failure()
+            logging.error(f"Redis pipeline failed: {e}")
+            return
+        finally:
+            redis_command_duration.observe(time.perf_counter() - started, "pipeline")
+        self.breaker.record_success()
+
+    async def delete(self, key: str):
+        self.local.delete(key)
+        await self._call_redis("delete", key)
+
+    async def eval(self, script: str, keys: List[str], *args) -> Tuple[bool, object]:
+        """
+        Run a Lua script in Redis.
+
+        Returns:
+        tuple: (False, None) when Redis is unavailable, otherwise (True, result of the script).
+        """
+        return await self._call_redis("eval", script, len(keys), *keys, *args)
+
+    async def coalesce(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[T]],
+        decode: Callable[[bytes], T],
+    ) -> T:
+        """
+        Make sure only one caller fetches a missing key from upstream.
+
+        Concurrent callers in this process await the same task. Across
+        workers and replicas a short Redis lease elects one fetcher; the
+        others poll the cache for the value it stores and fetch themselves
+        as soon as the lease is released or runs out without a value. The
+        winner of the lease reads the key again first, as the previous holder
+        may have stored it and released the lease after this caller's miss.
+
+        Parameters:
+        key (str): Cache key the fetch function stores its result under.
+        fetch (Callable): Coroutine function that calls upstream and writes the cache.
+        decode (Callable): Turns the cached bytes into the value fetch would return;
+            raises ValueError for values it can't read (e.g. an old schema).
+        """
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.counters["coalesced_local"] += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(self._fetch_with_lease(key, fetch, decode))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch_with_lease(self, key: str, fetch: Callable[[], Awaitable[T]], decode: Callable[[bytes], T]) -> T:
+        lease_key = f"lease:{key}"
+        token = uuid.uuid4().hex
+        ok, acquired = await self._call_redis("set", lease_key, token, nx=True, px=int(LEASE_SECONDS * 1000))
+        if ok and not acquired:
+            # Jiný worker už stahuje, počká se na jeho výsledek v Redisu
+            deadline = time.monotonic() + LEASE_SECONDS
+            while time.monotonic() < deadline:
+                await asyncio.sleep(LEASE_POLL_INTERVAL)
+                # Hodnota i zámek jedním dotazem: zámek se uvolní až po zápisu hodnoty
+                ok, values = await self._call_redis("mget", [key, lease_key])
+                if not ok:
+                    break
+                value, lease = values
+                found, result = self._remote_result(key, value, decode)
+                if found:
+                    return result
+                if lease is None:
+                    # Stahování skončilo bez zápisu (chyba ARES, vyčerpaný limit), nečeká se dál
+                    logging.info(f"Lease for {key} released without a value, fetching.")
+                    break
+            else:
+                logging.info(f"Lease for {key} expired without a value, fetching.")
+
+        try:
+            if ok and acquired:
+                # Předchozí držitel mohl hodnotu zapsat a zámek uvolnit až po našem minutí cache
+                fetched, value = await self._call_redis("get", key)
+                found, result = self._remote_result(key, value if fetched else None, decode)
+                if found:
+                    return result
+            return await fetch()
+        finally:
+            if ok and acquired:
+                await self._call_redis("eval", _RELEASE_LEASE_SCRIPT, 1, lease_key, token)
+
+    def _remote_result(self, key: str, value: Optional[bytes], decode: Callable[[bytes], T]) -> Tuple[bool, Optional[T]]:
+        """
+        Decode a value another worker stored in Redis and keep it in L1.
+
+        Returns:
+        tuple: (False, None) when there is no value or it's in an old format.
+        """
+        if value is None:
+            return False, None
+        try:
+            result = decode(value)
+        except ValueError:
+            # Záznam ve starém formátu, čeká se na nový
+            return False, None
+        self.counters["coalesced_remote"] += 1
+        self.local.set(key, value)
+        return True, result
+
+    def stats(self) -> Dict[str, object]:
+        l1_lookups = self.counters["l1_hits"] + self.counters["l1_misses"]
+        l2_lookups = self.counters["l2_hits"] + self.counters["l2_misses"]
+        return {
+            **self.counters,
+            "l1_hit_ratio": round(self.counters["l1_hits"] / l1_lookups, 3) if l1_lookups else 0.0,
+            "l2_hit_ratio": round(self.counters["l2_hits"] / l2_lookups, 3) if l2_lookups else 0.0,
+            "l1_entries": len(self.local),
+            "redis": self.breaker.snapshot(),
+        }
+
+    async def aclose(self):
+        if self.redis is not None:
+            await self.redis.aclose()
+
+
+try:
+    redis_instance = redis.Redis(
+        host=redis_host_name,
+        port=6379,
+        db=0,
+        socket_timeout=REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+        # Výchozí Retry opakuje neúspěšný příkaz s čekáním, takže jeden dotaz při
+        # výpadku Redisu trval sekundy; o dalším pokusu rozhoduje circuit breaker
+        retry=Retry(NoBackoff(), 0),
+    )
+except redis.RedisError as e:
+    logging.error(f"Nepodařilo se připojit k Redisu: {e}")
+    redis_instance = None
+
+cache = TwoTierCache(
+    redis_instance,
+    LocalCache(L1_MAX_ENTRIES, L1_TTL),
+    CircuitBreaker("redis", failure_threshold=3, reset_timeout=10.0),
+)
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
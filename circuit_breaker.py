@@ -0,0 +1,82 @@
+import time
+import logging
+
+from typing import Dict
+
+
+logging.basicConfig(
+    format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+
+class CircuitBreaker:
+    """
+    Stop calling a dependency after repeated failures.
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    `allow_request()` returns False for `reset_timeout` seconds. Then one
+    trial call is let through (half-open); its success closes the breaker,
+    its failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow_request(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial_in_progress:
+            self.trial_in_progress = True
+            return True
+        return False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logging.info(f"Circuit breaker '{self.name}' closed.")
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.trial_in_progress = False
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                logging.warning(f"Circuit breaker '{self.name}' opened for {self.reset_timeout} s.")
+            self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """
+        Let another trial through when the current one ended without an outcome (e.g. it was cancelled).
+        """
+        self.trial_in_progress = False
+
+    def snapshot(self) -> Dict[str, object]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
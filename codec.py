@@ -0,0 +1,131 @@
+import os
+import zlib
+import logging
+import msgpack
+
+from dataclasses import fields, is_dataclass
+from typing import Generic, List, Optional, Tuple, Type, TypeVar, Union, get_args, get_origin, get_type_hints
+
+
+logging.basicConfig(
+    format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# 0xC1 msgpack nikdy nepoužívá, takže se binární záznam nedá splést se starým JSON
+MAGIC = b"\xc1"
+FLAG_ZLIB = 0x01
+# Hodnoty větší než tento počet bajtů se komprimují
+COMPRESS_THRESHOLD = int(os.environ.get("CACHE_COMPRESS_THRESHOLD", 1024))
+
+T = TypeVar("T")
+
+
+class SchemaMismatch(ValueError):
+    """
+    Cached value was written by another format or schema version; treat it as a miss.
+    """
+
+
+def _nested_dataclass(annotation) -> Tuple[Optional[type], bool]:
+    """
+    Find a dataclass in X, Optional[X], List[X] or Optional[List[X]].
+
+    Returns:
+    tuple: (dataclass or None, True if the field holds a list of them).
+    """
+    if get_origin(annotation) is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) != 1:
+            return None, False
+        annotation = args[0]
+    if get_origin(annotation) in (list, List):
+        args = get_args(annotation)
+        item = args[0] if args else None
+        return (item, True) if is_dataclass(item) else (None, False)
+    return (annotation, False) if is_dataclass(annotation) else (None, False)
+
+
+class _Layout:
+    """
+    Dataclass encoded as a list of field values in declaration order.
+    """
+
+    def __init__(self, cls: type):
+        self.cls = cls
+        hints = get_type_hints(cls)
+        self.fields = []
+        for field in fields(cls):
+            nested, is_list = _nested_dataclass(hints[field.name])
+            self.fields.append((field.name, _Layout(nested) if nested else None, is_list))
+
+    def pack(self, obj) -> list:
+        values = []
+        for name, nested, is_list in self.fields:
+            value = getattr(obj, name)
+            if nested is not None and value is not None:
+                value = [nested.pack(item) for item in value] if is_list else nested.pack(value)
+            values.append(value)
+        return values
+
+    def unpack(self, values: list):
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise SchemaMismatch(f"{self.cls.__name__} expects {len(self.fields)} fields")
+        kwargs = {}
+        for (name, nested, is_list), value in zip(self.fields, values):
+            if nested is not None and value is not None:
+                value = [nested.unpack(item) for item in value] if is_list else nested.unpack(value)
+            kwargs[name] = value
+        return self.cls(**kwargs)
+
+
+class DataclassCodec(Generic[T]):
+    """
+    Compact, versioned binary encoding of one dataclass for the cache.
+
+    Layout: MAGIC, schema version byte, flags byte, then a msgpack array
+    [fetched_at, [field values...]], zlib-compressed when it is larger than
+    COMPRESS_THRESHOLD. Values of another version or format raise
+    SchemaMismatch, so old entries become misses without flushing Redis.
+    Bump `version` whenever fields are renamed or reordered; a changed
+    field count is detected on its own.
+    """
+
+    def __init__(self, cls: Type[T], version: int, compress_threshold: int = COMPRESS_THRESHOLD):
+        if not 0 < version < 256:
+            raise ValueError("Schema version must fit into one byte.")
+        self.cls = cls
+        self.version = version
+        self.compress_threshold = compress_threshold
+        self._layout = _Layout(cls)
+        self._header = MAGIC + bytes([version])
+
+    def encode(self, obj: T, fetched_at: float = 0.0) -> bytes:
+        body = msgpack.packb([fetched_at, self._layout.pack(obj)], use_bin_type=True)
+        flags = 0
+        if len(body) > self.compress_threshold:
+            body = zlib.compress(body)
+            flags |= FLAG_ZLIB
+        return self._header + bytes([flags]) + body
+
+    def decode_with_time(self, data: bytes) -> Tuple[T, float]:
+        if data[:2] != self._header or len(data) < 3:
+            raise SchemaMismatch(f"Not a {self.cls.__name__} v{self.version} entry")
+        try:
+            body = zlib.decompress(data[3:]) if data[2] & FLAG_ZLIB else data[3:]
+            fetched_at, values = msgpack.unpackb(body, raw=False)
+        except (ValueError, TypeError, zlib.error, msgpack.UnpackException) as e:
+            raise SchemaMismatch(f"Corrupted {self.cls.__name__} entry: {e}")
+        return self._layout.unpack(values), fetched_at
+
+    def decode(self, data: bytes) -> T:
+        return self.decode_with_time(data)[0]
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
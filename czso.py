@@ -1,11 +1,22 @@
+import os
+import re
+import zlib
 import logging
-import requests
 import unicodedata
-import os
-import redis
 import json
 
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+from bs4 import BeautifulSoup, UnicodeDammit
+from bs4.builder import HTMLParserTreeBuilder
+
+import http_client
+
+from cache import cache
+from tracing import span
+
+from reference_data import NaceNode, load_reference_data
 
 logging.basicConfig(
     format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
@@ -14,39 +25,80 @@ logging.basicConfig(
 )
 
 
-redis_host_name = os.environ.get("REDIS_HOST_NAME", "localhost")
 
-try:
-    redis_instance = redis.Redis(host=redis_host_name, port=6379, db=0)
-except redis.RedisError as e:
-    logging.error(f"Nepodařilo se připojit k Redisu: {e}")
-    redis_instance = None
 
+# Ukládá se jen vytažený CZ-NACE, ne celá stránka
+CZSO_TTL = 7 * 24 * 60 * 60  # 7 days in cache
+# Volitelná ladicí kopie surového HTML (komprimovaná), 0 ji vypne
+CZSO_DEBUG_HTML_TTL = int(os.environ.get("CZSO_DEBUG_HTML_TTL", 0))
 
-def czso_get_website_content(ico: str):
-    url = f"https://apl.czso.cz/res/detail?ico={ico}"
-    try:
-        # Check if data already exists in cache
-        if redis_instance is not None and redis_instance.exists(url):
-            logging.info(f"Use cached data for {url}")
-            data = json.loads(redis_instance.get(url).decode("utf-8"))
-            return data
 
-        response = requests.get(url)
-        response.raise_for_status()  # If the response contains an HTTP error status code, raise an exception
-        content = response.content
+def czso_url(ico: str) -> str:
+    return f"https://apl.czso.cz/res/detail?ico={ico}"
 
-        # Save to cache if Redis instance is available
-        if redis_instance is not None:
-            redis_instance.setex(url, 7 * 24 * 60 * 60, json.dumps(content.decode("utf-8"))) # 7 days in cache
 
-        return content
+async def czso_get_cz_nace(ico: str) -> Optional[List[str]]:
+    """
+    Get the normalized CZ-NACE values of a company from the ČSÚ register.
 
-    except requests.RequestException as e:
+    Parameters:
+    ico (str): IČO of the company.
+
+    Returns:
+    list|None: Parsed values as returned by czso_parse_content, None if the page couldn't be fetched or parsed.
+    """
+    redis_key = f"czso_cz_nace:{ico}"
+    with span("czso_cache"):
+        cached_data = await cache.get(redis_key)
+    if cached_data is not None:
+        logging.info(f"Use cached CZ-NACE for {ico}")
+        return czso_decode_cz_nace(cached_data)
+
+    # Concurrent misses for the same IČO share one download
+    return await cache.coalesce(redis_key, lambda: czso_fetch_cz_nace(ico, redis_key), czso_decode_cz_nace)
+
+
+def czso_decode_cz_nace(cached_data: bytes) -> List[str]:
+    return json.loads(cached_data)
+
+
+async def czso_fetch_cz_nace(ico: str, redis_key: str) -> Optional[List[str]]:
+    with span("czso_fetch"):
+        content = await czso_get_website_content(ico)
+    with span("czso_parse"):
+        parsed_content = czso_extract_cz_nace(content)
+    if parsed_content is None:
+        return None
+
+    await cache.set(redis_key, json.dumps(parsed_content), ttl=CZSO_TTL)
+    if CZSO_DEBUG_HTML_TTL > 0:
+        await cache.set(f"czso_html:{ico}", zlib.compress(content), ttl=CZSO_DEBUG_HTML_TTL, local=False)
+    return parsed_content
+
+
+async def czso_get_website_content(ico: str) -> Optional[bytes]:
+    url = czso_url(ico)
+    try:
+        response = await http_client.get("czso", url)
+        response.raise_for_status()  # If the response contains an HTTP error status code, raise an exception
+        return response.content
+
+    except http_client.HttpError as e:
         logging.error(f"Error occurred: {e}")
         return None
 
 
+async def czso_get_debug_html(ico: str) -> Optional[bytes]:
+    """
+    Returns:
+    bytes|None: Raw page kept in the debug tier, None if it's not there.
+    """
+    cached_data = await cache.get(f"czso_html:{ico}")
+    if cached_data is None:
+        return None
+    return zlib.decompress(cached_data)
+
+
 def czso_parse_content(content):
     if content is None:
         logging.warning("No content to parse.")
@@ -69,135 +121,170 @@ def czso_parse_content(content):
         return None
 
 
-def czso_get_categories():
-    return {
-        "A": "A - Zemědělství, lesnictví, rybářství",
-        "B": "B - Těžba a dobývání",
-        "C": "C - Zpracovatelský průmysl",
-        "D": "D - Výroba a rozvod elektřiny, plynu, tepla a klimatizovaného vzduchu",
-        "E": "E - Zásobování vodou; činnosti související s odpadními vodami, odpady a sanacemi",
-        "F": "F - Stavebnictví",
-        "G": "G - Velkoobchod a maloobchod; opravy a údržba motorových vozidel",
-        "H": "H - Doprava a skladování",
-        "I": "I - Ubytování, stravování a pohostinství",
-        "J": "J - Informační a komunikační činnosti",
-        "K": "K - Peněžnictví a pojišťovnictví",
-        "L": "L - Činnosti v oblasti nemovitostí",
-        "M": "M - Profesní, vědecké a technické činnosti",
-        "N": "N - Administrativní a podpůrné činnosti",
-        "O": "O - Veřejná správa a obrana; povinné sociální zabezpečení",
-        "P": "P - Vzdělávání",
-        "Q": "Q - Zdravotní a sociální péče",
-        "R": "R - Kulturní, zábavní a rekreační činnosti",
-        "S": "S - Ostatní činnosti",
-        "T": "T - Činnosti domácností jako zaměstnavatelů; činnosti domácností produkujících blíže neurčené výrobky a služby pro vlastní potřebu",
-        "U": "U - Činnosti exteritoriálních organizací a orgánů",
-    }
-
-
-def czso_get_categories_num():
-    return {
-        "01": "A - Zemědělství, lesnictví, rybářství",
-        "02": "A - Zemědělství, lesnictví, rybářství",
-        "03": "A - Zemědělství, lesnictví, rybářství",
-        "05": "B - Těžba a dobývání",
-        "06": "B - Těžba a dobývání",
-        "07": "B - Těžba a dobývání",
-        "08": "B - Těžba a dobývání",
-        "09": "B - Těžba a dobývání",
-        "10": "C - Zpracovatelský průmysl",
-        "11": "C - Zpracovatelský průmysl",
-        "12": "C - Zpracovatelský průmysl",
-        "13": "C - Zpracovatelský průmysl",
-        "14": "C - Zpracovatelský průmysl",
-        "15": "C - Zpracovatelský průmysl",
-        "16": "C - Zpracovatelský průmysl",
-        "17": "C - Zpracovatelský průmysl",
-        "18": "C - Zpracovatelský průmysl",
-        "19": "C - Zpracovatelský průmysl",
-        "20": "C - Zpracovatelský průmysl",
-        "21": "C - Zpracovatelský průmysl",
-        "22": "C - Zpracovatelský průmysl",
-        "23": "C - Zpracovatelský průmysl",
-        "24": "C - Zpracovatelský průmysl",
-        "25": "C - Zpracovatelský průmysl",
-        "26": "C - Zpracovatelský průmysl",
-        "27": "C - Zpracovatelský průmysl",
-        "28": "C - Zpracovatelský průmysl",
-        "29": "C - Zpracovatelský průmysl",
-        "30": "C - Zpracovatelský průmysl",
-        "31": "C - Zpracovatelský průmysl",
-        "32": "C - Zpracovatelský průmysl",
-        "33": "C - Zpracovatelský průmysl",
-        "35": "D - Výroba a rozvod elektřiny, plynu, tepla a klimatizovaného vzduchu",
-        "36": "E - Zásobování vodou; činnosti související s odpadními vodami, odpady a sanacemi",
-        "37": "E - Zásobování vodou; činnosti související s odpadními vodami, odpady a sanacemi",
-        "38": "E - Zásobování vodou; činnosti související s odpadními vodami, odpady a sanacemi",
-        "39": "E - Zásobování vodou; činnosti související s odpadními vodami, odpady a sanacemi",
-        "41": "F - Stavebnictví",
-        "42": "F - Stavebnictví",
-        "43": "F - Stavebnictví",
-        "45": "G - Velkoobchod a maloobchod; opravy a údržba motorových vozidel",
-        "46": "G - Velkoobchod a maloobchod; opravy a údržba motorových vozidel",
-        "47": "G - Velkoobchod a maloobchod; opravy a údržba motorových vozidel",
-        "49": "H - Doprava a skladování",
-        "50": "H - Doprava a skladování",
-        "51": "H - Doprava a skladování",
-        "52": "H - Doprava a skladování",
-        "53": "H - Doprava a skladování",
-        "55": "I - Ubytování, stravování a pohostinství",
-        "56": "I - Ubytování, stravování a pohostinství",
-        "58": "J - Informační a komunikační činnosti",
-        "59": "J - Informační a komunikační činnosti",
-        "60": "J - Informační a komunikační činnosti",
-        "61": "J - Informační a komunikační činnosti",
-        "62": "J - Informační a komunikační činnosti",
-        "63": "J - Informační a komunikační činnosti",
-        "64": "K - Peněžnictví a pojišťovnictví",
-        "65": "K - Peněžnictví a pojišťovnictví",
-        "66": "K - Peněžnictví a pojišťovnictví",
-        "68": "L - Činnosti v oblasti nemovitostí",
-        "69": "M - Profesní, vědecké a technické činnosti",
-        "70": "M - Profesní, vědecké a technické činnosti",
-        "71": "M - Profesní, vědecké a technické činnosti",
-        "72": "M - Profesní, vědecké a technické činnosti",
-        "73": "M - Profesní, vědecké a technické činnosti",
-        "74": "M - Profesní, vědecké a technické činnosti",
-        "75": "M - Profesní, vědecké a technické činnosti",
-        "77": "N - Administrativní a podpůrné činnosti",
-        "78": "N - Administrativní a podpůrné činnosti",
-        "79": "N - Administrativní a podpůrné činnosti",
-        "80": "N - Administrativní a podpůrné činnosti",
-        "81": "N - Administrativní a podpůrné činnosti",
-        "82": "N - Administrativní a podpůrné činnosti",
-        "84": "O - Veřejná správa a obrana; povinné sociální zabezpečení",
-        "85": "P - Vzdělávání",
-        "86": "Q - Zdravotní a sociální péče",
-        "87": "Q - Zdravotní a sociální péče",
-        "88": "Q - Zdravotní a sociální péče",
-        "90": "R - Kulturní, zábavní a rekreační činnosti",
-        "91": "R - Kulturní, zábavní a rekreační činnosti",
-        "92": "R - Kulturní, zábavní a rekreační činnosti",
-        "93": "R - Kulturní, zábavní a rekreační činnosti",
-        "94": "S - Ostatní činnosti",
-        "95": "S - Ostatní činnosti",
-        "96": "S - Ostatní činnosti",
-        "97": "T - Činnosti domácností jako zaměstnavatelů; činnosti domácností produkujících blíže neurčené výrobky a služby pro vlastní potřebu",
-        "98": "T - Činnosti domácností jako zaměstnavatelů; činnosti domácností produkujících blíže neurčené výrobky a služby pro vlastní potřebu",
-        "99": "U - Činnosti exteritoriálních organizací a orgánů",
-    }
+# Cesta k hodnotě CZ-NACE pod libovolným <body>, stejná jako selektor v czso_parse_content
+CZSO_CZ_NACE_PATH = (("div", 2), ("div", 2), ("div", 7), ("div", 2))
+# Další shodu může přinést jen další <body> (stejně vyhledává html.parser název tagu)
+_BODY_START_RE = re.compile(r"<body(?![^\t\n\r\f />\x00])", re.IGNORECASE)
+_VOID_ELEMENTS = frozenset(HTMLParserTreeBuilder().empty_element_tags)
+
+
+class _CzNaceFound(Exception):
+    pass
+
+
+class CzNaceLocator(HTMLParser):
+    """
+    Find where the elements selected by czso_parse_content start and end in the page.
+
+    Uses the same tokenizer as BeautifulSoup's html.parser builder and its
+    nesting rules: no implied end tags, an end tag closes the most recent
+    open element of that name (and everything inside it), void elements
+    close at once. The tree is never built; each open element keeps only
+    its per-tag child counts (for :nth-of-type) and how far along
+    CZSO_CZ_NACE_PATH it is.
+    """
+
+    def __init__(self, text: str):
+        super().__init__(convert_charrefs=False)
+        self.page = text
+        # [tag, počty potomků podle tagu, krok cesty (0 = body, None = mimo cestu), začátek]
+        self.stack = [["[document]", {}, None, 0]]
+        self.already_closed_empty_element: List[str] = []
+        self.spans: List[Tuple[int, int]] = []
+        self._line_starts: Optional[List[int]] = None
+
+    def _position(self) -> int:
+        if self._line_starts is None:
+            self._line_starts = [0] + [match.end() for match in re.finditer("\n", self.page)]
+        line, column = self.getpos()
+        return self._line_starts[line - 1] + column
+
+    def handle_starttag(self, tag, attrs):
+        self._push(tag)
+        if tag in _VOID_ELEMENTS:
+            self._pop_to(tag)
+            # Případný </br> apod. se pak ignoruje, stejně jako v BeautifulSoup
+            self.already_closed_empty_element.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self._push(tag)
+        self._pop_to(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self.already_closed_empty_element:
+            self.already_closed_empty_element.remove(tag)
+        else:
+            self._pop_to(tag)
+
+    def _push(self, tag: str):
+        parent = self.stack[-1]
+        parent[1][tag] = position = parent[1].get(tag, 0) + 1
+        step = parent[2]
+        if tag == "body":
+            step = 0
+        elif step is not None and step < len(CZSO_CZ_NACE_PATH) and CZSO_CZ_NACE_PATH[step] == (tag, position):
+            step += 1
+        else:
+            step = None
+        start = self._position() if step == len(CZSO_CZ_NACE_PATH) else 0
+        self.stack.append([tag, {}, step, start])
+
+    def _pop_to(self, tag: str):
+        if not any(element[0] == tag for element in self.stack[1:]):
+            return
+        while True:
+            element = self.stack.pop()
+            if element[2] == len(CZSO_CZ_NACE_PATH):
+                end = self._position()
+                if self.page.startswith("</", end):
+                    # I s koncovým tagem, jinak by text končící "&amp" zůstal bez entity
+                    end = self.page.index(">", end + 1) + 1
+                self._found(element[3], end)
+            if element[0] == tag:
+                return
+
+    def _found(self, start: int, end: int):
+        self.spans.append((start, end))
+        # Cesta pod jedním <body> je jednoznačná, další shoda potřebuje jiné <body>
+        open_bodies = sum(1 for element in self.stack if element[0] == "body")
+        if open_bodies <= 1 and _BODY_START_RE.search(self.page, end) is None:
+            raise _CzNaceFound()
+
+    def locate(self) -> List[Tuple[int, int]]:
+        try:
+            self.feed(self.page)
+            self.close()
+        except _CzNaceFound:
+            return sorted(self.spans)
+        # Co zůstalo otevřené, končí s dokumentem
+        while len(self.stack) > 1:
+            element = self.stack.pop()
+            if element[2] == len(CZSO_CZ_NACE_PATH):
+                self.spans.append((element[3], len(self.page)))
+        return sorted(self.spans)
+
+
+def czso_extract_cz_nace(content):
+    """
+    Fast replacement for czso_parse_content.
+
+    CzNaceLocator walks the page without building a tree and stops once
+    the selected element is closed; only that element is then handed to
+    BeautifulSoup for its text, so script and style content, entities and
+    unclosed tags are treated exactly as before.
+
+    Parameters:
+    content (bytes|None): Page from czso_get_website_content.
+
+    Returns:
+    list|None: Same value as czso_parse_content would return.
+    """
+    if content is None:
+        logging.warning("No content to parse.")
+        return None
+
+    try:
+        # Stejné rozpoznání kódování jako v BeautifulSoup
+        text = content if isinstance(content, str) else UnicodeDammit(content, is_html=True).unicode_markup
+        return [
+            unicodedata.normalize("NFKD", BeautifulSoup(text[start:end], "html.parser").get_text())
+            for start, end in CzNaceLocator(text).locate()
+        ]
+    except Exception as e:
+        logging.error(f"Error occurred while parsing: {e}")
+        return None
 
 
 def czso_get_base_cz_nace(input_string: str) -> str:
-    categories = czso_get_categories()
-    categories_num = czso_get_categories_num()
-    first_character = input_string[0]
-    first_two_characters = input_string[:2]
+    section = load_reference_data().nace_index.section(input_string)
+    if section is not None:
+        return section.label
 
+    first_character = input_string[:1]
     if first_character.isalpha():
-        return categories.get(first_character.upper(), "Neznámá kategorie")
+        return "Neznámá kategorie"
     elif first_character.isdigit():
-        return categories_num.get(first_two_characters, "Neznámá sub-kategorie")
+        return "Neznámá sub-kategorie"
+
+
+def czso_get_cz_nace_hierarchy(input_string: str) -> List[NaceNode]:
+    return list(load_reference_data().nace_index.resolve(input_string))
+
+
+def czso_apply_cz_nace(company_data, parsed_content: Optional[List[str]]):
+    """
+    Fill the main CZ-NACE of a company from the ČSÚ register.
+
+    Parameters:
+    company_data (AresCompany): Company from ARES, updated in place.
+    parsed_content (list|None): Result of czso_get_cz_nace; nothing changes when it's empty.
+    """
+    if not parsed_content:
+        return
+    main_cz_nace = str(parsed_content[0])
+    company_data.main_cz_nace = main_cz_nace
+    company_data.based_main_cz_nace = czso_get_base_cz_nace(main_cz_nace)
+    company_data.main_cz_nace_hierarchy = czso_get_cz_nace_hierarchy(main_cz_nace)
 
 
 def main():
@@ -0,0 +1,399 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import aiohttp
+
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Mapping
+
+from metrics import upstream_error_kind, upstream_errors, upstream_request_duration, upstream_requests_in_flight
+from ratelimit import RateLimited, limiter
+from resilience import UpstreamGuard
+
+
+logging.basicConfig(
+    format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+
+class HttpError(Exception):
+    """Transport error, timeout or error status of an upstream request."""
+
+
+class UpstreamUnavailable(HttpError):
+    """Circuit breaker of the upstream is open, the request wasn't sent."""
+
+
+class HttpStatusError(HttpError):
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@dataclass
+class HttpResponseHead:
+    url: str
+    status_code: int
+    headers: Mapping[str, str]
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HttpStatusError(f"Status code for request to {self.url} is {self.status_code}", self.status_code)
+
+
+@dataclass
+class HttpResponse(HttpResponseHead):
+    content: bytes
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+@dataclass
+class HttpStream(HttpResponseHead):
+    """Response whose body is read in chunks, see stream()."""
+
+    _response: aiohttp.ClientResponse = field(repr=False, default=None)
+
+    async def iter_chunks(self, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        try:
+            async for chunk in self._response.content.iter_chunked(chunk_size):
+                yield chunk
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise HttpError(f"Reading {self.url} failed: {e!r}") from e
+
+
+@dataclass(frozen=True)
+class UpstreamConfig:
+    limit: int = 100
+    limit_per_host: int = 50
+    keepalive_timeout: float = 30.0
+    connect_timeout: float = 3.05
+    read_timeout: float = 10.0
+    # Celkový limit na jeden požadavek včetně případného hedgingu a čtení těla
+    deadline: float = 20.0
+    breaker_failures: int = 5
+    breaker_reset: float = 30.0
+    # Druhý souběžný GET po překročení p95 latence
+    hedge: bool = False
+    hedge_min_delay: float = 0.05
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "UpstreamConfig":
+        """
+        Build the config for an upstream, allowing overrides such as
+        ARES_HTTP_LIMIT_PER_HOST, CZSO_HTTP_READ_TIMEOUT or VAT_HTTP_HEDGE.
+        """
+        config = cls(**defaults)
+        prefix = f"{name.upper()}_HTTP_"
+        return cls(
+            limit=int(os.environ.get(prefix + "LIMIT", config.limit)),
+            limit_per_host=int(os.environ.get(prefix + "LIMIT_PER_HOST", config.limit_per_host)),
+            keepalive_timeout=float(os.environ.get(prefix + "KEEPALIVE_TIMEOUT", config.keepalive_timeout)),
+            connect_timeout=float(os.environ.get(prefix + "CONNECT_TIMEOUT", config.connect_timeout)),
+            read_timeout=float(os.environ.get(prefix + "READ_TIMEOUT", config.read_timeout)),
+            deadline=float(os.environ.get(prefix + "DEADLINE", config.deadline)),
+            breaker_failures=int(os.environ.get(prefix + "BREAKER_FAILURES", config.breaker_failures)),
+            breaker_reset=float(os.environ.get(prefix + "BREAKER_RESET", config.breaker_reset)),
+            hedge=os.environ.get(prefix + "HEDGE", str(config.hedge)).lower() in ("1", "true", "yes"),
+            hedge_min_delay=float(os.environ.get(prefix + "HEDGE_MIN_DELAY", config.hedge_min_delay)),
+        )
+
+    @property
+    def timeout(self) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(total=self.deadline, sock_connect=self.connect_timeout, sock_read=self.read_timeout)
+
+
+UPSTREAMS: Dict[str, UpstreamConfig] = {
+    "ares": UpstreamConfig.from_env("ares", read_timeout=10.0, deadline=12.0),
+    "czso": UpstreamConfig.from_env("czso", read_timeout=15.0, deadline=20.0),
+    "vat": UpstreamConfig.from_env("vat", read_timeout=15.0, deadline=20.0),
+    "brandfetch": UpstreamConfig.from_env("brandfetch", read_timeout=10.0, deadline=12.0),
+    # Loga se stahují z CDN Brandfetche, případně z libovolného hostitele,
+    # takže jeden nedostupný web nesmí vypnout stahování všech log
+    "logo": UpstreamConfig.from_env("logo", read_timeout=20.0, deadline=60.0, breaker_failures=50),
+}
+# Hedging jen u požadavků, které lze bez následků poslat dvakrát
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+
+_sessions: Dict[str, aiohttp.ClientSession] = {}
+_guards: Dict[str, UpstreamGuard] = {}
+_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"requests": 0, "connections": 0, "reused": 0})
+
+
+def _trace_config(upstream: str) -> aiohttp.TraceConfig:
+    counters = _stats[upstream]
+
+    async def on_request_start(session, context, params):
+        counters["requests"] += 1
+
+    async def on_connection_create_end(session, context, params):
+        counters["connections"] += 1
+
+    async def on_connection_reuseconn(session, context, params):
+        counters["reused"] += 1
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    return trace_config
+
+
+def get_session(upstream: str) -> aiohttp.ClientSession:
+    """
+    Return the shared keep-alive session for the given upstream.
+
+    Parameters:
+    upstream (str): Name of the upstream, one of UPSTREAMS.
+
+    Returns:
+    aiohttp.ClientSession: Session with its own per-host connection pools.
+    """
+    session = _sessions.get(upstream)
+    if session is None or session.closed:
+        config = UPSTREAMS[upstream]
+        connector = aiohttp.TCPConnector(
+            limit=config.limit,
+            limit_per_host=config.limit_per_host,
+            keepalive_timeout=config.keepalive_timeout,
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=config.timeout,
+            trace_configs=[_trace_config(upstream)],
+        )
+        _sessions[upstream] = session
+    return session
+
+
+def get_guard(upstream: str) -> UpstreamGuard:
+    guard = _guards.get(upstream)
+    if guard is None:
+        config = UPSTREAMS[upstream]
+        guard = _guards[upstream] = UpstreamGuard(
+            upstream,
+            failure_threshold=config.breaker_failures,
+            reset_timeout=config.breaker_reset,
+            hedge=config.hedge,
+            hedge_min_delay=config.hedge_min_delay,
+        )
+    return guard
+
+
+def _is_failure(status_code: int) -> bool:
+    # 4xx kromě 429 je odpověď o datech (neexistující IČO), ne porucha služby
+    return status_code >= 500 or status_code == 429
+
+
+async def _admit(upstream: str, url: str) -> UpstreamGuard:
+    """
+    Check the upstream's circuit breaker and take a token from its rate limit budget.
+
+    Raises:
+    UpstreamUnavailable: When the breaker is open.
+    ratelimit.RateLimited: When no token is available in time.
+    """
+    guard = get_guard(upstream)
+    if not guard.allow_request():
+        upstream_errors.inc(upstream, "circuit_open")
+        raise UpstreamUnavailable(f"Circuit breaker '{upstream}' is open, {url} not requested.")
+    try:
+        await limiter.acquire(upstream)
+    except BaseException:
+        guard.breaker.release_trial()
+        raise
+    return guard
+
+
+async def _admit_hedge(upstream: str) -> bool:
+    """
+    Take a token for a hedged copy of a request without waiting for it.
+
+    Returns:
+    bool: False when the upstream's budget has no token left, the copy is then not sent.
+    """
+    try:
+        await limiter.acquire(upstream, max_wait=0)
+    except RateLimited:
+        return False
+    return True
+
+
+async def request(method: str, upstream: str, url: str, **kwargs) -> HttpResponse:
+    """
+    Send a request through the pooled session of the upstream and read the body.
+
+    The upstream's connect/read timeouts and overall deadline apply unless
+    `timeout` is given. GET requests of upstreams with hedging enabled get
+    a second copy after the upstream's p95 latency, if a token for it is
+    available right away. Upstreams with a rate limit budget
+    (ratelimit.BUDGETS) wait briefly for a token first.
+
+    Raises:
+    UpstreamUnavailable: When the upstream's circuit breaker is open.
+    ratelimit.RateLimited: When the upstream's rate limit budget is used up.
+    HttpError: On connection errors and timeouts.
+    """
+    config = UPSTREAMS[upstream]
+    guard = await _admit(upstream, url)
+    started = time.perf_counter()
+    try:
+        send = lambda: _send(method, upstream, url, **kwargs)  # noqa: E731
+        hedge_admit = lambda: _admit_hedge(upstream)  # noqa: E731
+        call = guard.hedged(send, hedge_admit) if method in IDEMPOTENT_METHODS else send()
+        response = await asyncio.wait_for(call, timeout=config.deadline)
+    except asyncio.TimeoutError as e:
+        guard.counters["deadline_exceeded"] += 1
+        guard.record_failure()
+        upstream_errors.inc(upstream, "deadline")
+        raise HttpError(f"Request to {url} exceeded the {config.deadline} s deadline") from e
+    except HttpError:
+        guard.record_failure()
+        raise
+    except asyncio.CancelledError:
+        # Volající to vzdal (vlastní limit), o stavu služby to nic neříká
+        guard.breaker.release_trial()
+        raise
+    if _is_failure(response.status_code):
+        guard.record_failure()
+    else:
+        guard.record_success(time.perf_counter() - started)
+    return response
+
+
+async def _send(method: str, upstream: str, url: str, **kwargs) -> HttpResponse:
+    upstream_requests_in_flight.inc(upstream)
+    started = time.perf_counter()
+    try:
+        async with get_session(upstream).request(method, url, **kwargs) as response:
+            content = await response.read()
+            if response.status >= 400:
+                upstream_errors.inc(upstream, upstream_error_kind(response.status))
+            return HttpResponse(
+                url=str(response.url),
+                status_code=response.status,
+                headers=response.headers.copy(),
+                content=content,
+            )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        upstream_errors.inc(upstream, "timeout" if isinstance(e, asyncio.TimeoutError) else "connection")
+        raise HttpError(f"Request to {url} failed: {e!r}") from e
+    finally:
+        upstream_requests_in_flight.dec(upstream)
+        upstream_request_duration.observe(time.perf_counter() - started, upstream)
+
+
+@asynccontextmanager
+async def stream(method: str, upstream: str, url: str, **kwargs) -> AsyncIterator[HttpStream]:
+    """
+    Like request(), but leave the body unread so it can be consumed with
+    `iter_chunks()`. Leaving the block early drops the rest of the body.
+    Streams are never hedged; the upstream's deadline covers the whole body.
+
+    Raises:
+    UpstreamUnavailable: When the upstream's circuit breaker is open.
+    ratelimit.RateLimited: When the upstream's rate limit budget is used up.
+    HttpError: On connection errors and timeouts.
+    """
+    guard = await _admit(upstream, url)
+    upstream_requests_in_flight.inc(upstream)
+    started = time.perf_counter()
+    recorded = False
+    try:
+        async with get_session(upstream).request(method, url, **kwargs) as response:
+            if response.status >= 400:
+                upstream_errors.inc(upstream, upstream_error_kind(response.status))
+            # Stav služby se posoudí podle hlavičky, čtení těla řídí volající
+            if _is_failure(response.status):
+                guard.record_failure()
+            else:
+                guard.record_success()
+            recorded = True
+            yield HttpStream(
+                url=str(response.url),
+                status_code=response.status,
+                headers=response.headers.copy(),
+                _response=response,
+            )
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        upstream_errors.inc(upstream, "timeout" if isinstance(e, asyncio.TimeoutError) else "connection")
+        if not recorded:
+            guard.record_failure()
+            recorded = True
+        raise HttpError(f"Request to {url} failed: {e!r}") from e
+    finally:
+        if not recorded:
+            guard.breaker.release_trial()
+        # U streamu se měří celé stažení včetně těla
+        upstream_requests_in_flight.dec(upstream)
+        upstream_request_duration.observe(time.perf_counter() - started, upstream)
+
+
+async def get(upstream: str, url: str, **kwargs) -> HttpResponse:
+    return await request("GET", upstream, url, **kwargs)
+
+
+async def post(upstream: str, url: str, **kwargs) -> HttpResponse:
+    return await request("POST", upstream, url, **kwargs)
+
+
+async def aclose():
+    sessions = list(_sessions.values())
+    _sessions.clear()
+    await asyncio.gather(*(session.close() for session in sessions), return_exceptions=True)
+
+
+def connection_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Report how many requests reused an already open connection.
+
+    Returns:
+    dict: Per upstream the number of requests, opened connections, reused
+        connections and the reuse ratio.
+    """
+    stats = {}
+    for upstream, counters in list(_stats.items()):
+        requests_count = counters["requests"]
+        stats[upstream] = {
+            "requests": requests_count,
+            "connections": counters["connections"],
+            "reused": counters["reused"],
+            "reuse_ratio": round(counters["reused"] / requests_count, 3) if requests_count else 0.0,
+        }
+    return stats
+
+
+def upstream_stats() -> Dict[str, Dict[str, object]]:
+    """
+    Report the resilience state of every upstream: breaker, latency percentiles, hedging and deadlines.
+    """
+    return {
+        upstream: {
+            **get_guard(upstream).snapshot(),
+            "connect_timeout": config.connect_timeout,
+            "read_timeout": config.read_timeout,
+            "deadline": config.deadline,
+            "hedge": config.hedge,
+            "rate_limit": limiter.stats().get(upstream),
+        }
+        for upstream, config in UPSTREAMS.items()
+    }
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+
+logging.basicConfig(
+    format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Vykreslená PNG se ukládají mimo adresáře domén, podle obsahu SVG a šířky
+RENDER_DIR = os.environ.get("LOGO_RENDER_DIR", os.path.join("logos", ".rendered"))
+RENDER_WORKERS = int(os.environ.get("LOGO_RENDER_WORKERS", 2))
+MIN_RENDER_SIZE = 16
+MAX_RENDER_SIZE = 1024
+
+_pool: Optional[ProcessPoolExecutor] = None
+_in_flight: Dict[str, asyncio.Future] = {}
+
+
+def render_svg_to_png(svg_path: str, png_path: str, width: Optional[int] = None):
+    """
+    Render an SVG file to PNG. Runs in a worker process.
+
+    Parameters:
+    svg_path (str): Source SVG file.
+    png_path (str): Where the PNG is written; it's first written next to it and then renamed.
+    width (int|None): Width in pixels, the height keeps the aspect ratio. None keeps the SVG size.
+    """
+    import cairosvg
+
+    temp_path = f"{png_path}.{os.getpid()}.tmp"
+    cairosvg.svg2png(url=svg_path, write_to=temp_path, output_width=width)
+    os.replace(temp_path, png_path)
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forkovat proces s běžící smyčkou událostí a vlákny není bezpečné
+        _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def rendered_path(svg_path: str, width: Optional[int] = None, digest: Optional[str] = None) -> str:
+    if digest is None:
+        with open(svg_path, "rb") as file:
+            digest = hashlib.sha256(file.read()).hexdigest()
+    return os.path.join(RENDER_DIR, f"{digest}_{width or 'original'}.png")
+
+
+async def render_logo_png(svg_path: str, width: Optional[int] = None, digest: Optional[str] = None) -> str:
+    """
+    Get a PNG rendering of an SVG logo, rendering it only if it isn't on disk yet.
+
+    Renders run in a bounded process pool so they don't block the server,
+    and concurrent requests for the same logo and width share one render.
+
+    Parameters:
+    svg_path (str): Path to the SVG logo.
+    width (int|None): Width of the PNG in pixels, None keeps the SVG size.
+    digest (str|None): SHA-256 of the SVG if the caller already knows it.
+
+    Returns:
+    str: Path to the rendered PNG.
+    """
+    png_path = rendered_path(svg_path, width, digest)
+    if os.path.exists(png_path):
+        return png_path
+
+    future = _in_flight.get(png_path)
+    if future is None:
+        os.makedirs(RENDER_DIR, exist_ok=True)
+        logging.info(f"Rendering {svg_path} to {png_path}.")
+        loop = asyncio.get_running_loop()
+        future = asyncio.ensure_future(
+            loop.run_in_executor(get_pool(), render_svg_to_png, svg_path, png_path, width)
+        )
+        _in_flight[png_path] = future
+        future.add_done_callback(lambda _: _in_flight.pop(png_path, None))
+
+    await asyncio.shield(future)
+    return png_path
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import os
+import glob
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from logo_render import RENDER_DIR
+
+
+logging.basicConfig(
+    format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+LOGO_STORE_DIR = os.environ.get("LOGO_STORE_DIR", "logos")
+# Kolik místa smí loga na disku zabrat, nejdéle nepoužitá se mažou
+LOGO_STORE_BUDGET_BYTES = int(os.environ.get("LOGO_STORE_BUDGET_BYTES", 500 * 1024 * 1024))
+# Čas posledního použití se do indexu zapisuje nejvýš jednou za tolik sekund
+ACCESS_WRITE_INTERVAL = float(os.environ.get("LOGO_STORE_ACCESS_WRITE_INTERVAL", 60))
+# Po překročení rozpočtu se maže až na tento podíl, aby se tabulka neřadila po každém novém logu
+EVICT_TO_RATIO = float(os.environ.get("LOGO_STORE_EVICT_TO_RATIO", 0.9))
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.svg')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    extension TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS domains (
+    domain TEXT PRIMARY KEY,
+    digest TEXT NOT NULL REFERENCES blobs(digest)
+);
+CREATE INDEX IF NOT EXISTS domains_digest ON domains(digest);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+@dataclass
+class LogoEntry:
+    path: str
+    digest: str
+
+
+class LogoStore:
+    """
+    Content-addressed store of downloaded logos.
+
+    Every image is kept once under blobs/<hash>, whatever the number of
+    domains using it; a SQLite index maps domains to hashes and tracks
+    when each blob was last served. When the blobs grow over the disk
+    budget, the least recently used ones are deleted together with their
+    domains and rendered PNGs. Lookups are answered from memory; access
+    times and hit/miss counters are written to the index in batches, so
+    all workers and the maintenance command see them.
+
+    Only `cached()` is meant for the event loop; the other methods touch
+    SQLite or the disk and are run in a thread pool by the app. A lock
+    serializes their use of the shared connection.
+    """
+
+    def __init__(self, root: str = LOGO_STORE_DIR, budget_bytes: int = LOGO_STORE_BUDGET_BYTES):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.blob_dir = os.path.join(root, "blobs")
+        self.temp_dir = os.path.join(root, ".tmp")
+        self.db_path = os.path.join(root, "store.sqlite3")
+        self.entries: Dict[str, LogoEntry] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        self._pending_access: Dict[str, float] = {}
+        self._pending_counters = {"hits": 0, "misses": 0}
+        self._last_flush = time.monotonic()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._db is None:
+                os.makedirs(self.root, exist_ok=True)
+                self._db = sqlite3.connect(self.db_path, timeout=5.0, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.executescript(_SCHEMA)
+            return self._db
+
+    def blob_path(self, digest: str, extension: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest + extension)
+
+    def open(self):
+        """
+        Load the index into memory, importing logos saved in the old logos/<domain>/ layout.
+        """
+        os.makedirs(self.temp_dir, exist_ok=True)
+        self._import_legacy_directories()
+        with self._lock:
+            rows = self.db.execute("SELECT domains.domain, blobs.digest, blobs.extension FROM domains JOIN blobs USING (digest)")
+            self.entries = {domain: LogoEntry(self.blob_path(digest, extension), digest) for domain, digest, extension in rows}
+        logging.info(f"Logo store contains {len(self.entries)} domains.")
+        self.evict()
+
+    def _import_legacy_directories(self):
+        with os.scandir(self.root) as directories:
+            legacy = [d.path for d in directories if d.is_dir() and not d.name.startswith('.') and d.name != "blobs"]
+        for directory in legacy:
+            files = sorted(f for f in glob.glob(os.path.join(glob.escape(directory), '*')) if f.lower().endswith(IMAGE_EXTENSIONS))
+            try:
+                if files:
+                    with open(files[0], 'rb') as file:
+                        digest = hashlib.sha256(file.read()).hexdigest()
+                    self.put(os.path.basename(directory), files[0], os.path.splitext(files[0])[1].lower(), digest, move=False)
+                shutil.rmtree(directory)
+            except OSError as e:
+                # Jiný worker adresář mezitím převedl
+                logging.warning(f"Importing {directory} into the logo store failed: {e}")
+        if legacy:
+            logging.info(f"Imported {len(legacy)} logo directories into the logo store.")
+
+    def cached(self, domain: str) -> Optional[LogoEntry]:
+        """
+        Look the domain up in memory only, without touching SQLite.
+
+        Returns:
+        LogoEntry|None: Entry of a logo that is on disk; None means get() has to ask the index.
+        """
+        entry = self.entries.get(domain)
+        if entry is None or not os.path.exists(entry.path):
+            return None
+        self._pending_counters["hits"] += 1
+        self._pending_access[entry.digest] = time.time()
+        return entry
+
+    def get(self, domain: str) -> Optional[LogoEntry]:
+        entry = self.entries.get(domain)
+        if entry is None:
+            # Logo mohl mezitím uložit jiný worker
+            with self._lock:
+                row = self.db.execute(
+                    "SELECT blobs.digest, blobs.extension FROM domains JOIN blobs USING (digest) WHERE domain = ?", (domain,)
+                ).fetchone()
+            if row is not None:
+                entry = self.entries[domain] = LogoEntry(self.blob_path(*row), row[0])
+        if entry is not None and not os.path.exists(entry.path):
+            # Smazáno při uvolňování místa v jiném workeru
+            self.entries.pop(domain, None)
+            entry = None
+
+        self._pending_counters["hits" if entry is not None else "misses"] += 1
+        if entry is not None:
+            self._pending_access[entry.digest] = time.time()
+        if time.monotonic() - self._last_flush >= ACCESS_WRITE_INTERVAL:
+            self.flush()
+        return entry
+
+    def put(self, domain: str, file_path: str, extension: str, digest: str, move: bool = True) -> LogoEntry:
+        """
+        Store a downloaded logo under its content hash and point the domain at it.
+
+        The disk budget is not enforced here, call evict() afterwards.
+
+        Parameters:
+        domain (str): Domain of the company.
+        file_path (str): Downloaded file; it's moved into the store (or copied when `move` is False).
+        extension (str): File extension including the dot, e.g. ".svg".
+        digest (str): SHA-256 of the file content.
+
+        Returns:
+        LogoEntry: Entry of the stored logo.
+        """
+        with self._lock:
+            row = self.db.execute("SELECT extension FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if row is not None:
+                # Stejný obsah mohl přijít s jinou příponou (.jpg / .jpeg)
+                extension = row[0]
+            path = self.blob_path(digest, extension)
+            size = os.path.getsize(file_path)
+            if os.path.exists(path):
+                # Stejný obrázek už v úložišti je
+                if move:
+                    os.remove(file_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if move:
+                    os.replace(file_path, path)
+                else:
+                    shutil.copyfile(file_path, path)
+
+            with self.db:
+                self.db.execute(
+                    "INSERT INTO blobs (digest, extension, size, last_access) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(digest) DO UPDATE SET last_access = excluded.last_access",
+                    (digest, extension, size, time.time()),
+                )
+                self.db.execute(
+                    "INSERT INTO domains (domain, digest) VALUES (?, ?) "
+                    "ON CONFLICT(domain) DO UPDATE SET digest = excluded.digest",
+                    (domain, digest),
+                )
+            entry = self.entries[domain] = LogoEntry(path, digest)
+        return entry
+
+    def evict(self, budget_bytes: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Delete the least recently used blobs once the store is over the budget,
+        down to EVICT_TO_RATIO of it, so the next few puts don't evict again.
+
+        Returns:
+        tuple: (number of deleted blobs, freed bytes).
+        """
+        budget_bytes = self.budget_bytes if budget_bytes is None else budget_bytes
+        self.flush()
+        with self._lock:
+            total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+            if total <= budget_bytes:
+                return 0, 0
+            rows = self.db.execute("SELECT digest, extension, size FROM blobs ORDER BY last_access").fetchall()
+
+        target_bytes = budget_bytes * EVICT_TO_RATIO
+        evicted, freed = 0, 0
+        for digest, extension, size in rows:
+            if total - freed <= target_bytes:
+                break
+            with self._lock, self.db:
+                domains = [row[0] for row in self.db.execute("SELECT domain FROM domains WHERE digest = ?", (digest,))]
+                self.db.execute("DELETE FROM domains WHERE digest = ?", (digest,))
+                self.db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            for domain in domains:
+                self.entries.pop(domain, None)
+            for path in [self.blob_path(digest, extension)] + glob.glob(os.path.join(RENDER_DIR, f"{digest}_*")):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            evicted += 1
+            freed += size
+        logging.info(f"Logo store evicted {evicted} blobs, freed {freed} bytes.")
+        return evicted, freed
+
+    def flush(self):
+        """
+        Write batched access times and hit/miss counters to the index.
+        """
+        self._last_flush = time.monotonic()
+        if not self._pending_access and not any(self._pending_counters.values()):
+            return
+        pending_access, self._pending_access = self._pending_access, {}
+        pending_counters, self._pending_counters = self._pending_counters, {"hits": 0, "misses": 0}
+        try:
+            with self._lock, self.db:
+                self.db.executemany(
+                    "UPDATE blobs SET last_access = MAX(last_access, ?) WHERE digest = ?",
+                    [(accessed_at, digest) for digest, accessed_at in pending_access.items()],
+                )
+                self.db.executemany(
+                    "INSERT INTO counters (name, value) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+                    list(pending_counters.items()),
+                )
+        except sqlite3.Error as e:
+            logging.error(f"Writing the logo store index failed: {e}")
+
+    def report(self) -> Dict[str, object]:
+        self.flush()
+        with self._lock:
+            return self._report()
+
+    def _report(self) -> Dict[str, object]:
+        blobs, stored_bytes = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+        domains, referenced_bytes = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(blobs.size), 0) FROM domains JOIN blobs USING (digest)"
+        ).fetchone()
+        counters = dict(self.db.execute("SELECT name, value FROM counters"))
+        lookups = counters.get("hits", 0) + counters.get("misses", 0)
+        return {
+            "domains": domains,
+            "blobs": blobs,
+            "stored_bytes": stored_bytes,
+            "budget_bytes": self.budget_bytes,
+            # Kolik by loga zabrala, kdyby měla každá doména vlastní kopii
+            "bytes_saved_by_dedup": referenced_bytes - stored_bytes,
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "hit_rate": round(counters.get("hits", 0) / lookups, 3) if lookups else 0.0,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            with self._lock:
+                self._db.close()
+                self._db = None
+
+
+logo_store = LogoStore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintenance of the logo store.")
+    parser.add_argument("command", choices=["report", "evict"], help="report: print statistics, evict: enforce the disk budget")
+    parser.add_argument("--budget", type=int, help="Disk budget in bytes for evict, defaults to LOGO_STORE_BUDGET_BYTES.")
+    args = parser.parse_args()
+
+    logo_store.open()
+    if args.command == "evict":
+        evicted, freed = logo_store.evict(args.budget)
+        print(f"Evicted {evicted} blobs, freed {freed} bytes.")
+    for name, value in logo_store.report().items():
+        print(f"{name}: {value}")
+    logo_store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,66 @@
+import os
+import asyncio
 import logging
-from fastapi import FastAPI, HTTPException, Request
+from contextlib import asynccontextmanager
+from fastapi import Body, FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.encoders import jsonable_encoder
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, PlainTextResponse, Response
 from pathlib import Path
+from typing import Dict, List, Optional
 
-from ares import AresCompany, new_get_company_data_ares
+import http_client
+import metrics
+import tracing
+from cache import cache
+from ares import (
+    ARES_REFRESH_TOP_N,
+    AresCompany,
+    AresCompanyResult,
+    get_companies_data_ares,
+    new_get_company_data_ares,
+    run_hot_company_refresher,
+)
 from helper import get_better_formated_domain
-from czso import czso_get_website_content, czso_parse_content, czso_get_base_cz_nace
-from vat_new import VatInfo, Company
+from czso import czso_apply_cz_nace, czso_get_cz_nace, czso_get_debug_html
+from vat_new import VAT_TRANSIENT_ERRORS, VatInfo, Company
 from verification import verify_ico, verify_vat
-from brandfetch_info import get_logo, get_logo_path, convert_svg_to_png
+from brandfetch_info import brandfetch_cache_stats, get_logo, get_media_type, run_logo_store_maintenance
+from logo_store import logo_store
+from ares_mirror import ares_mirror
+from name_search import NAME_INDEX_SNAPSHOT_INTERVAL, name_index, run_snapshots, save_snapshot
+from logo_render import MAX_RENDER_SIZE, MIN_RENDER_SIZE, render_logo_png, shutdown_pool
+from reference_data import load_reference_data
+from ratelimit import RateLimited, retry_after_header
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Číselníky se načtou jednou při startu, ne až při prvním požadavku
+    load_reference_data()
+    await run_in_threadpool(logo_store.open)
+    await run_in_threadpool(name_index.load)
+    refresher = asyncio.create_task(run_hot_company_refresher()) if ARES_REFRESH_TOP_N > 0 else None
+    snapshots = asyncio.create_task(run_snapshots()) if NAME_INDEX_SNAPSHOT_INTERVAL > 0 else None
+    logo_maintenance = asyncio.create_task(run_logo_store_maintenance())
+    yield
+    logo_maintenance.cancel()
+    if refresher is not None:
+        refresher.cancel()
+    if snapshots is not None:
+        snapshots.cancel()
+    if name_index.dirty:
+        await save_snapshot(name_index)
+    await http_client.aclose()
+    await cache.aclose()
+    shutdown_pool()
+    await run_in_threadpool(logo_store.close)
+    ares_mirror.close()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(tracing.TracingMiddleware)
 
 logging.basicConfig(
     format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
@@ -20,12 +69,46 @@ logging.basicConfig(
 )
 
 
+# Celkový časový limit pro obohacení jedné firmy (ARES + ČSÚ)
+COMPANY_DEADLINE_SECONDS = float(os.environ.get("COMPANY_DEADLINE_SECONDS", 8))
+# Maximální počet IČO v jednom hromadném dotazu
+COMPANIES_BATCH_LIMIT = int(os.environ.get("COMPANIES_BATCH_LIMIT", 5000))
+# Jak dlouho si prohlížeče a CDN smí logo držet bez ověření
+LOGO_CACHE_MAX_AGE = int(os.environ.get("LOGO_CACHE_MAX_AGE", 7 * 24 * 60 * 60))
+
+
+@app.exception_handler(RateLimited)
+async def handle_rate_limited(request: Request, error: RateLimited):
+    # Vyčerpaný rozpočet dotazů na ARES, klient to má zkusit znovu později
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(error)},
+        headers={"Retry-After": retry_after_header(error)},
+    )
+
+
+@app.exception_handler(http_client.HttpError)
+async def handle_upstream_error(request: Request, error: http_client.HttpError):
+    # Výpadek ARES nebo služby DIČ (spojení, deadline, otevřený jistič, 5xx), ne odpověď o datech
+    return JSONResponse(status_code=503, content={"detail": "Upstream service is unavailable."})
+
+
 def raise_http_400_error(detail: str):
     raise HTTPException(status_code=400, detail=detail)
 
 def raise_http_404_error(detail: str):
     raise HTTPException(status_code=404, detail=detail)
 
+def raise_http_504_error(detail: str):
+    raise HTTPException(status_code=504, detail=detail)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
 
 def check_for_spaces(input_string: str, error_message: str):
     if input_string != input_string.strip():
@@ -49,54 +132,100 @@ def get_root(request: Request):
     description="Get company information by IČO.",
     response_model=AresCompany,
 )
-def get_company(company_ico: str):
+async def get_company(company_ico: str):
     logging.info(f"Someone asked for IČO: {company_ico}")
     check_for_spaces(company_ico, "IČ number should not contain spaces.")
     if not verify_ico(company_ico):
         raise_http_400_error("Invalid ICO")
+    # Zrcadlo i cache jsou klíčované osmimístným IČO, stejně jako u /companies
+    ico = company_ico.zfill(8)
 
-    
-    company_data = new_get_company_data_ares(company_ico.strip())
+    # ČSÚ potřebuje jen IČO, takže se stahuje souběžně s ARES
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + COMPANY_DEADLINE_SECONDS
+    czso_task = asyncio.create_task(czso_get_cz_nace(ico))
+
+    try:
+        company_data = await asyncio.wait_for(
+            new_get_company_data_ares(ico), timeout=COMPANY_DEADLINE_SECONDS
+        )
+    except asyncio.TimeoutError:
+        czso_task.cancel()
+        raise_http_504_error("ARES did not respond in time.")
+    except http_client.HttpError:
+        czso_task.cancel()
+        raise
 
     if company_data is None:
+        czso_task.cancel()
         raise_http_404_error("IČO doesn´t found.")
 
-    content = czso_get_website_content(company_ico.strip())
-    parsed_content = czso_parse_content(content)
-    if parsed_content:
-        ares_main_economic_activity_cz_nace = str(parsed_content[0])
-        ares_based_main_economic_activity_cz_nace = czso_get_base_cz_nace(
-            ares_main_economic_activity_cz_nace
-        )
+    try:
+        # shield: po vypršení limitu stahování doběhne na pozadí a uloží se do cache
+        with tracing.span("czso_wait"):
+            parsed_content = await asyncio.wait_for(asyncio.shield(czso_task), timeout=max(deadline - loop.time(), 0))
+    except asyncio.TimeoutError:
+        logging.warning(f"ČSÚ did not respond in time for IČO {company_ico}, returning ARES data only.")
+        parsed_content = None
+    except Exception as e:
+        logging.error(f"ČSÚ lookup failed for IČO {company_ico}: {e}")
+        parsed_content = None
 
-        setattr(company_data, "main_cz_nace", ares_main_economic_activity_cz_nace)
-        setattr(
-            company_data,
-            "based_main_cz_nace",
-            ares_based_main_economic_activity_cz_nace,
-        )
+    with tracing.span("nace"):
+        czso_apply_cz_nace(company_data, parsed_content)
 
     return jsonable_encoder(company_data)
 
 
+@app.post(
+    "/companies",
+    description="Get company information for a list of IČOs. Returns a result or an error for every IČO.",
+    response_model=Dict[str, AresCompanyResult],
+)
+async def get_companies(company_icos: List[str] = Body(...)):
+    if len(company_icos) > COMPANIES_BATCH_LIMIT:
+        raise_http_400_error(f"At most {COMPANIES_BATCH_LIMIT} IČOs can be requested at once.")
+
+    results: Dict[str, AresCompanyResult] = {}
+    valid_icos = {}
+    for company_ico in dict.fromkeys(company_icos):
+        if company_ico != company_ico.strip():
+            results[company_ico] = AresCompanyResult(error="IČ number should not contain spaces.")
+        elif not verify_ico(company_ico):
+            results[company_ico] = AresCompanyResult(error="Invalid ICO")
+        else:
+            valid_icos[company_ico] = company_ico.zfill(8)
+
+    companies = await get_companies_data_ares(valid_icos.values())
+    results = {
+        company_ico: results.get(company_ico) or companies[valid_icos[company_ico]]
+        for company_ico in dict.fromkeys(company_icos)
+    }
+
+    return jsonable_encoder(results)
+
+
 @app.get(
     "/companyVAT/{vat_number}",
     description="Get company information by VAT number.",
     response_model=Company,
 )
-def get_vat_company(vat_number: str):
+async def get_vat_company(vat_number: str):
     check_for_spaces(vat_number, "VAT number should not contain spaces.")
 
     if not verify_vat(vat_number):
         raise_http_400_error("Invalid VAT number based on library pyvat.")
 
     vat_info = VatInfo(vat_number.strip())
-    company = vat_info.get_vat_info()
+    company = await vat_info.get_vat_info()
 
     if company is None:
         raise_http_400_error("Company doesn´t exist.")
 
     if not company.isValid:
+        if company.userError in VAT_TRANSIENT_ERRORS:
+            # VIES je nedostupný, o platnosti DIČ to nic neříká
+            raise HTTPException(status_code=503, detail=company.userError)
         raise_http_400_error(company.userError)
 
     return company
@@ -106,21 +235,91 @@ def get_vat_company(vat_number: str):
     "/logo/{domain}",
     response_class=FileResponse,
     tags=["logo"],
-    description="Download and save a company logo by domain. Please provide a pure domain name, e.g., 'mluvii.com', not 'https://mluvii.com'.",
+    description="Download and save a company logo by domain. Please provide a pure domain name, e.g., 'mluvii.com', not 'https://mluvii.com'. "
+    "SVG logos are returned as PNG, `size` sets its width in pixels.",
 )
-def get_company_logo(domain: str):
+async def get_company_logo(
+    request: Request,
+    domain: str,
+    size: Optional[int] = Query(None, ge=MIN_RENDER_SIZE, le=MAX_RENDER_SIZE),
+):
     if domain is None:
         raise HTTPException(status_code=404, detail="No input")
         
     domain_better_formated = get_better_formated_domain(domain.lower().strip())
     company_name = domain_better_formated.split('.')[0]
-    get_logo(domain_better_formated)
+    logo = await get_logo(domain_better_formated)
+    if logo is None:
+        raise HTTPException(status_code=404, detail="Logo not found")
+
+    logo_path = logo.path
+    media_type = get_media_type(logo_path)
+    etag = f'"{logo.digest}"'
+    if logo_path.lower().endswith(".svg"):
+        media_type = "image/png"
+        etag = f'"{logo.digest}-{size or "original"}"'
+
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={LOGO_CACHE_MAX_AGE}"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    if logo_path.lower().endswith(".svg"):
+        # Vykreslení běží v procesech a výsledek se ukládá na disk
+        logo_path = await render_logo_png(logo_path, size, logo.digest)
+    return FileResponse(logo_path, media_type=media_type, filename=company_name, headers=headers)
+
+
+@app.get(
+    "/search",
+    description="Find companies by name. Matches whole words and word beginnings, ignores diacritics and case. "
+    "Searches companies this service has already fetched from ARES or ingested from the ARES dumps.",
+)
+async def search_companies(
+    q: str = Query(..., min_length=2, max_length=200),
+    limit: int = Query(10, ge=1, le=100),
+):
+    return {"query": q, "results": name_index.search(q, limit)}
+
+
+@app.get("/metrics", include_in_schema=False, response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/slow-requests", include_in_schema=False)
+async def get_slow_requests(limit: Optional[int] = Query(None, ge=1)):
+    return {
+        "threshold_seconds": tracing.slow_requests.threshold,
+        "requests": tracing.slow_requests.slowest(limit),
+    }
+
+
+@app.get("/debug/czso-html/{company_ico}", include_in_schema=False)
+async def get_czso_debug_html(company_ico: str):
+    if not verify_ico(company_ico):
+        raise_http_400_error("Invalid ICO")
+    # Stránka se ukládá jen při CZSO_DEBUG_HTML_TTL > 0
+    content = await czso_get_debug_html(company_ico.zfill(8))
+    if content is None:
+        raise_http_404_error("No ČSÚ page is kept for this IČO.")
+    return Response(content=content, media_type="text/html")
+
+
+@app.get("/stats/http", include_in_schema=False)
+async def get_http_stats():
+    return http_client.connection_stats()
+
 
-    logo_path = get_logo_path(domain_better_formated)
+@app.get("/stats/upstreams", include_in_schema=False)
+async def get_upstream_stats():
+    return http_client.upstream_stats()
 
-    if logo_path:
-        if logo_path.lower().endswith(".svg"):
-            logo_path = convert_svg_to_png(logo_path)
-        return FileResponse(logo_path, media_type="image/png", filename=company_name)
 
-    raise HTTPException(status_code=404, detail="Logo not found")
+@app.get("/stats/cache", include_in_schema=False)
+async def get_cache_stats():
+    return {
+        **cache.stats(),
+        "brandfetch": brandfetch_cache_stats(),
+        "ares_mirror": ares_mirror.stats(),
+        "name_index": name_index.stats(),
+    }
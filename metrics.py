@@ -0,0 +1,200 @@
+import time
+import bisect
+import logging
+
+from typing import Dict, List, Sequence, Tuple
+
+
+logging.basicConfig(
+    format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Hranice pro latence v sekundách, od zásahu do L1 po pomalé ARES
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Endpointy s vlastní sadou metrik, ostatní cesty spadnou do "other"
+TRACKED_ENDPOINTS = {"company", "companies", "companyVAT", "logo", "search"}
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """
+    Base of the metric types; label values are passed positionally in `labelnames` order.
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value}" for labels, value in list(self.values.items())]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) - amount
+
+    def set(self, value: float, *labels: str):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Pro každou kombinaci štítků: počty v jednotlivých koších (poslední je +Inf) a součet
+        self.values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in list(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total[0]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+http_request_duration = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "Latency of API requests.", ("endpoint", "method", "status")
+))
+http_requests_in_flight = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "API requests being handled.", ("endpoint",)
+))
+upstream_request_duration = REGISTRY.register(Histogram(
+    "upstream_request_duration_seconds", "Latency of requests to upstream services.", ("upstream",)
+))
+upstream_errors = REGISTRY.register(Counter(
+    "upstream_errors_total", "Failed upstream requests by kind (timeout, connection, http_4xx, http_5xx).", ("upstream", "kind")
+))
+upstream_requests_in_flight = REGISTRY.register(Gauge(
+    "upstream_requests_in_flight", "Requests to upstream services waiting for a response.", ("upstream",)
+))
+upstream_rate_limited = REGISTRY.register(Counter(
+    "upstream_rate_limited_total", "Upstream requests that had to wait for a token or were refused.", ("upstream", "outcome")
+))
+redis_command_duration = REGISTRY.register(Histogram(
+    "redis_command_duration_seconds", "Round-trip time of Redis commands.", ("command",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5),
+))
+redis_errors = REGISTRY.register(Counter(
+    "redis_errors_total", "Failed Redis commands.", ("command",)
+))
+cache_lookups = REGISTRY.register(Counter(
+    "cache_lookups_total", "Cache lookups by key family and result (l1_hit, l2_hit, miss).", ("family", "result")
+))
+
+
+def key_family(key: str) -> str:
+    """
+    Group cache keys for metrics: "vat_info:CZ:123" -> "vat_info", "27405354_company_data_test" -> "company_data_test".
+    """
+    if ":" in key:
+        return key.split(":", 1)[0]
+    return key.lstrip("0123456789_") or "other"
+
+
+def upstream_error_kind(status_code: int) -> str:
+    return f"http_{status_code // 100}xx"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording latency and in-flight requests per endpoint.
+
+    Endpoints are labelled by their first path segment ("/company/123" ->
+    "/company") so label cardinality stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        segment = scope["path"].split("/", 2)[1]
+        endpoint = f"/{segment}" if segment in TRACKED_ENDPOINTS else "other"
+        status = ["500"]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = str(message["status"])
+            await send(message)
+
+        http_requests_in_flight.inc(endpoint)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec(endpoint)
+            http_request_duration.observe(time.perf_counter() - started, endpoint, scope["method"], status[0])
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
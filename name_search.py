@@ -0,0 +1,435 @@
+import os
+import re
+import time
+import asyncio
+import heapq
+import bisect
+import fcntl
+import pickle
+import logging
+import argparse
+import unicodedata
+
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+
+logging.basicConfig(
+    format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+NAME_INDEX_PATH = os.environ.get("NAME_INDEX_PATH", "name_index.pickle")
+# Jak často se nové názvy připojují ke snapshotu a snapshot jiných procesů načítá, 0 ukládá jen při vypnutí
+NAME_INDEX_SNAPSHOT_INTERVAL = float(os.environ.get("NAME_INDEX_SNAPSHOT_INTERVAL", 300))
+# Na kolik slov ze slovníku se nejvýš rozvine jedna předpona
+MAX_PREFIX_EXPANSION = 200
+# Kratší slova (s, r, o z "s.r.o.") se neindexují
+MIN_TOKEN_LENGTH = 2
+# Překlepy: slova dotazu od této délky smí mít jednu úpravu (Levenshtein), od druhé délky dvě
+FUZZY_ONE_EDIT_LENGTH = 4
+FUZZY_TWO_EDITS_LENGTH = 8
+# Skóre slova nalezeného s překlepem podle počtu úprav (přesná shoda 2, předpona 1)
+TYPO_SCORES = {1: 0.5, 2: 0.25}
+SNAPSHOT_VERSION = 1
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def fold_text(text: str) -> str:
+    """
+    Lower-case text without diacritics: the NFKD normalization used in czso.py with combining marks dropped.
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN_RE.findall(fold_text(text)) if len(token) >= MIN_TOKEN_LENGTH]
+
+
+def max_typos(token: str) -> int:
+    if len(token) >= FUZZY_TWO_EDITS_LENGTH:
+        return 2
+    return 1 if len(token) >= FUZZY_ONE_EDIT_LENGTH else 0
+
+
+def snapshot_file_id(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+@contextmanager
+def snapshot_lock(path: str) -> Iterator[None]:
+    """
+    Hold an exclusive lock of the snapshot while it is merged and rewritten.
+    """
+    with open(f"{path}.lock", "ab") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@dataclass
+class SnapshotWrite:
+    file_id: Optional[Tuple[int, int]]
+    # Názvy, které se do snapshotu zapsaly
+    saved: Dict[str, str]
+    # Snapshot jiného procesu doplněný o naše názvy, None když se zapsal tento index
+    merged: Optional["NameIndex"]
+
+
+class NameIndex:
+    """
+    In-process full-text index of company names for /search.
+
+    Names are folded (no diacritics, lower case) and split into words; an
+    inverted index maps every word to the IČOs whose name contains it and
+    a sorted vocabulary answers prefix queries with two bisects. Updates
+    are incremental: a changed name replaces the old words of the IČO.
+
+    The snapshot on disk is built by `ares_mirror.py ingest`. Workers
+    reload it when the file changes and merge the names they added since
+    into it instead of overwriting it; see save_snapshot() and
+    reload_snapshot(), which keep the file work off the event loop.
+    """
+
+    def __init__(self):
+        self.names: Dict[str, str] = {}
+        self.postings: Dict[str, Set[str]] = {}
+        self._vocabulary: List[str] = []
+        self._new_tokens: Set[str] = set()
+        # Názvy přidané od posledního načtení nebo uložení snapshotu
+        self._pending: Dict[str, str] = {}
+        self._file_id: Optional[Tuple[int, int]] = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self._pending)
+
+    def add(self, ico: Optional[str], name: Optional[str]):
+        if not ico or not name or self.names.get(ico) == name:
+            return
+        self.remove(ico)
+        self.names[ico] = name
+        for token in set(tokenize(name)):
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = set()
+                self._new_tokens.add(token)
+            postings.add(ico)
+        self._pending[ico] = name
+
+    def add_many(self, companies: Iterable[Tuple[str, str]]):
+        for ico, name in companies:
+            self.add(ico, name)
+
+    def remove(self, ico: str):
+        name = self.names.pop(ico, None)
+        if name is None:
+            return
+        for token in set(tokenize(name)):
+            # Prázdné slovo zůstává ve slovníku, při hledání se přeskočí
+            self.postings.get(token, set()).discard(ico)
+
+    def vocabulary(self) -> List[str]:
+        if self._new_tokens:
+            if len(self._new_tokens) < 1000:
+                for token in self._new_tokens:
+                    bisect.insort(self._vocabulary, token)
+            else:
+                self._vocabulary = sorted(self.postings)
+            self._new_tokens = set()
+        return self._vocabulary
+
+    def expand_prefix(self, prefix: str) -> List[str]:
+        vocabulary = self.vocabulary()
+        start = bisect.bisect_left(vocabulary, prefix)
+        end = bisect.bisect_left(vocabulary, prefix + "\uffff", start)
+        return [token for token in vocabulary[start:min(end, start + MAX_PREFIX_EXPANSION)] if self.postings[token]]
+
+    def expand_typos(self, token: str) -> Dict[str, int]:
+        """
+        Find words of the vocabulary within max_typos(token) edits of the token.
+
+        The sorted vocabulary is walked like a trie, carrying one row of the
+        Levenshtein table per character and leaving every branch whose row
+        is already over the limit. Words have to start with the same letter,
+        which keeps the walk to a small part of the vocabulary.
+
+        Returns:
+        dict: Word -> edit distance, at most MAX_PREFIX_EXPANSION closest words.
+        """
+        limit = max_typos(token)
+        if not limit:
+            return {}
+        vocabulary = self.vocabulary()
+        found: Dict[str, int] = {}
+
+        def walk(prefix: str, previous_row: List[int], start: int, end: int):
+            # vocabulary[start:end] jsou právě slova začínající na prefix
+            if vocabulary[start] == prefix:
+                if previous_row[-1] <= limit and self.postings[prefix]:
+                    found[prefix] = previous_row[-1]
+                start += 1
+            while start < end:
+                char = vocabulary[start][len(prefix)]
+                child = prefix + char
+                child_end = bisect.bisect_left(vocabulary, child + "\uffff", start, end)
+                row = [previous_row[0] + 1]
+                for column in range(1, len(token) + 1):
+                    row.append(min(
+                        row[column - 1] + 1,
+                        previous_row[column] + 1,
+                        previous_row[column - 1] + (token[column - 1] != char),
+                    ))
+                if min(row) <= limit:
+                    walk(child, row, start, child_end)
+                start = child_end
+
+        first = token[0]
+        start = bisect.bisect_left(vocabulary, first)
+        end = bisect.bisect_left(vocabulary, first + "\uffff", start)
+        if start < end:
+            walk(first, [1] + [column - 1 for column in range(1, len(token) + 1)], start, end)
+        closest = heapq.nsmallest(MAX_PREFIX_EXPANSION, found.items(), key=lambda item: (item[1], item[0]))
+        return dict(closest)
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, object]]:
+        """
+        Find companies whose name contains all words of the query, each word also matching as a prefix.
+
+        Exact word matches score higher than prefix matches, names starting
+        with the query and shorter names rank first. A word that matches
+        nothing, not even as a prefix, is looked up with typos (see
+        expand_typos()); such matches score lower the more edits they need.
+        When no name contains all the words, names matching the most of them
+        are returned.
+
+        Parameters:
+        query (str): Searched name or its beginning, diacritics and case are ignored.
+        limit (int): Maximum number of results.
+
+        Returns:
+        list: {"ico", "name", "score"} sorted from the best match.
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+
+        # Pro každé slovo dotazu: IČO s přesně tímto slovem, IČO se slovem na tuto předponu
+        # a u slova bez shody skóre IČO nalezených s překlepem
+        matches = []
+        for token in tokens:
+            exact = self.postings.get(token) or set()
+            prefixed = set().union(*(self.postings[candidate] for candidate in self.expand_prefix(token)))
+            typos: Dict[str, float] = {}
+            if not prefixed:
+                for candidate, distance in self.expand_typos(token).items():
+                    for ico in self.postings[candidate]:
+                        typos[ico] = max(typos.get(ico, 0.0), TYPO_SCORES[distance])
+                prefixed = set(typos)
+            matches.append((exact, prefixed, typos))
+
+        # Přednost mají názvy obsahující všechna slova dotazu
+        candidates = set.intersection(*sorted((prefixed for _, prefixed, _ in matches), key=len))
+        if not candidates:
+            matched = Counter(ico for _, prefixed, _ in matches for ico in prefixed)
+            if not matched:
+                return []
+            best = max(matched.values())
+            candidates = {ico for ico, count in matched.items() if count == best}
+        scores = {
+            ico: sum(
+                2.0 if ico in exact else typos.get(ico, 1.0)
+                for exact, prefixed, typos in matches if ico in prefixed
+            )
+            for ico in candidates
+        }
+
+        # Levné předřazení, teprve užší výběr se porovná se začátkem názvu
+        shortlist = heapq.nlargest(limit * 10, scores, key=lambda ico: scores[ico] - len(self.names[ico]) / 1000)
+        folded_query = " ".join(tokens)
+
+        def rank(ico: str) -> float:
+            folded_name = " ".join(tokenize(self.names[ico]))
+            bonus = 1.0 if folded_name.startswith(folded_query) else 0.0
+            return scores[ico] + bonus - len(folded_name) / 1000
+
+        ranked = sorted(((rank(ico), ico) for ico in shortlist), reverse=True)[:limit]
+        return [{"ico": ico, "name": self.names[ico], "score": round(score, 3)} for score, ico in ranked]
+
+    @classmethod
+    def read(cls, path: str = NAME_INDEX_PATH) -> Optional["NameIndex"]:
+        """
+        Read a snapshot written by save() into a new index; this one isn't touched, so it can run in a thread.
+
+        Returns:
+        NameIndex|None: None when there is no usable snapshot.
+        """
+        file_id = snapshot_file_id(path)
+        if file_id is None:
+            return None
+        started = time.monotonic()
+        try:
+            with open(path, "rb") as file:
+                version, names, postings = pickle.load(file)
+        except (OSError, pickle.UnpicklingError, ValueError, EOFError) as e:
+            logging.error(f"Loading the name index from {path} failed: {e}")
+            return None
+        if version != SNAPSHOT_VERSION:
+            logging.warning(f"Name index snapshot {path} has version {version}, ignoring it.")
+            return None
+        index = cls()
+        index.names, index.postings = names, postings
+        index._vocabulary = sorted(postings)
+        index._file_id = file_id
+        logging.info(f"Loaded the name index with {len(names)} companies in {time.monotonic() - started:.2f} s.")
+        return index
+
+    def read_if_changed(self, path: str = NAME_INDEX_PATH) -> Optional["NameIndex"]:
+        """
+        Like read(), but only when the snapshot was replaced since this index loaded or saved it.
+        """
+        if snapshot_file_id(path) == self._file_id:
+            return None
+        return NameIndex.read(path)
+
+    def adopt(self, snapshot: "NameIndex"):
+        """
+        Take over the contents of a snapshot from read(), keeping the names added here and not saved yet.
+        """
+        self.names, self.postings = snapshot.names, snapshot.postings
+        self._vocabulary, self._new_tokens = snapshot._vocabulary, set()
+        self._file_id = snapshot._file_id
+        pending, self._pending = self._pending, {}
+        self.add_many(pending.items())
+
+    def load(self, path: str = NAME_INDEX_PATH) -> bool:
+        """
+        Replace the index with a snapshot written by save().
+
+        Returns:
+        bool: False when there is no usable snapshot.
+        """
+        snapshot = NameIndex.read(path)
+        if snapshot is None:
+            return False
+        self.adopt(snapshot)
+        return True
+
+    def write_snapshot(self, path: str = NAME_INDEX_PATH) -> SnapshotWrite:
+        """
+        Merge the names added here into the snapshot on disk and replace it atomically.
+
+        If another process replaced the snapshot since this index read it,
+        that snapshot is read and the added names are applied to it, so
+        nothing written by ingest or other workers is lost. This index isn't
+        modified, so the method can run in a thread; pass the result to
+        finish_write().
+        """
+        started = time.monotonic()
+        saved = dict(self._pending)
+        with snapshot_lock(path):
+            merged = self.read_if_changed(path)
+            if merged is not None:
+                merged.add_many(saved.items())
+                names, postings = merged.names, merged.postings
+            else:
+                names, postings = self.names, self.postings
+            # dumps běží celé v C, souběžné přidávání ve smyčce událostí ho nepřeruší
+            data = pickle.dumps((SNAPSHOT_VERSION, names, postings), protocol=pickle.HIGHEST_PROTOCOL)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, path)
+            file_id = snapshot_file_id(path)
+        if merged is not None:
+            merged._file_id = file_id
+        logging.info(
+            f"Saved {len(saved)} new names into the name index of {len(names)} companies "
+            f"in {time.monotonic() - started:.2f} s."
+        )
+        return SnapshotWrite(file_id, saved, merged)
+
+    def finish_write(self, result: SnapshotWrite):
+        for ico, name in result.saved.items():
+            if self._pending.get(ico) == name:
+                del self._pending[ico]
+        if result.merged is not None:
+            self.adopt(result.merged)
+        else:
+            self._file_id = result.file_id
+
+    def save(self, path: str = NAME_INDEX_PATH):
+        """
+        Merge the added names into the snapshot on disk, see write_snapshot().
+        """
+        self.finish_write(self.write_snapshot(path))
+
+    def stats(self) -> Dict[str, int]:
+        return {"companies": len(self.names), "words": sum(1 for postings in self.postings.values() if postings)}
+
+
+name_index = NameIndex()
+
+
+async def save_snapshot(index: NameIndex = name_index, path: str = NAME_INDEX_PATH):
+    result = await run_in_threadpool(index.write_snapshot, path)
+    index.finish_write(result)
+
+
+async def reload_snapshot(index: NameIndex = name_index, path: str = NAME_INDEX_PATH):
+    snapshot = await run_in_threadpool(index.read_if_changed, path)
+    if snapshot is not None:
+        index.adopt(snapshot)
+
+
+async def run_snapshots(index: NameIndex = name_index, interval: float = NAME_INDEX_SNAPSHOT_INTERVAL):
+    """
+    Every `interval` seconds merge the names added here into the snapshot,
+    or reload the snapshot when ingest or another worker replaced it.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if index.dirty:
+                await save_snapshot(index)
+            else:
+                await reload_snapshot(index)
+        except OSError as e:
+            logging.error(f"Saving the name index failed: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Company name index behind /search.")
+    parser.add_argument("command", choices=["search", "report"])
+    parser.add_argument("query", nargs="?", default="")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--path", default=NAME_INDEX_PATH)
+    args = parser.parse_args()
+
+    name_index.load(args.path)
+    if args.command == "search":
+        for result in name_index.search(args.query, args.limit):
+            print(f"{result['ico']}  {result['name']}  ({result['score']})")
+    else:
+        for name, value in name_index.stats().items():
+            print(f"{name}: {value}")
+
+
+if __name__ == "__main__":
+    main()
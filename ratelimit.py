@@ -0,0 +1,171 @@
+import os
+import math
+import time
+import asyncio
+import logging
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from cache import cache
+from metrics import upstream_rate_limited
+
+
+logging.basicConfig(
+    format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Jak dlouho smí požadavek čekat ve frontě na token, než se odmítne
+RATE_LIMIT_MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT", 1.0))
+
+# Token bucket v Redisu sdílený všemi workery a repliky. Čas bere z Redisu,
+# aby nevadily rozjeté hodiny podů. Vrací {1, 0} při přidělení tokenu,
+# jinak {0, ms do dalšího tokenu}.
+_TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+local wait_ms = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait_ms = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, wait_ms}
+"""
+
+
+class RateLimited(Exception):
+    """No token for the upstream within RATE_LIMIT_MAX_WAIT; retry after `retry_after` seconds."""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"Rate limit of {upstream} reached, retry in {retry_after:.2f} s.")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+@dataclass(frozen=True)
+class Budget:
+    rate: float  # tokens per second for the whole cluster
+    burst: int
+
+    @classmethod
+    def from_env(cls, name: str, rate: float, burst: int) -> "Budget":
+        """
+        Read overrides such as ARES_RATE_LIMIT (requests per second) and ARES_RATE_BURST.
+        """
+        return cls(
+            rate=float(os.environ.get(f"{name.upper()}_RATE_LIMIT", rate)),
+            burst=int(os.environ.get(f"{name.upper()}_RATE_BURST", burst)),
+        )
+
+
+# Rozpočty pro celý cluster; služby bez rozpočtu se neomezují
+BUDGETS: Dict[str, Budget] = {
+    "ares": Budget.from_env("ares", rate=8.0, burst=20),
+    "czso": Budget.from_env("czso", rate=2.0, burst=5),
+}
+
+
+class LocalBucket:
+    """
+    Same token bucket kept in the process, used while Redis is unavailable.
+
+    Each worker then gets the whole budget, so the cluster can go over it
+    by the number of workers; still better than no limit at all.
+    """
+
+    def __init__(self, budget: Budget):
+        self.budget = budget
+        self.tokens = float(budget.burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> Tuple[bool, float]:
+        now = time.monotonic()
+        self.tokens = min(self.budget.burst, self.tokens + (now - self.updated) * self.budget.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / self.budget.rate
+
+
+class RateLimiter:
+    def __init__(self, budgets: Dict[str, Budget] = BUDGETS, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        self.budgets = budgets
+        self.max_wait = max_wait
+        self.local = {upstream: LocalBucket(budget) for upstream, budget in budgets.items()}
+        self.counters = {upstream: {"granted": 0, "waited": 0, "rejected": 0, "local": 0} for upstream in budgets}
+
+    async def _take(self, upstream: str) -> Tuple[bool, float]:
+        budget = self.budgets[upstream]
+        ok, result = await cache.eval(_TOKEN_BUCKET_SCRIPT, [f"ratelimit:{upstream}"], budget.rate, budget.burst)
+        if not ok:
+            self.counters[upstream]["local"] += 1
+            return self.local[upstream].take()
+        allowed, wait_ms = result
+        return bool(allowed), int(wait_ms) / 1000
+
+    async def acquire(self, upstream: str, max_wait: Optional[float] = None):
+        """
+        Take a token for one request to the upstream, waiting for it at most `max_wait` seconds.
+
+        Parameters:
+        upstream (str): Name of the upstream; upstreams without a budget return at once.
+        max_wait (float|None): Defaults to RATE_LIMIT_MAX_WAIT, 0 refuses instead of waiting.
+
+        Raises:
+        RateLimited: When no token becomes available in time.
+        """
+        if upstream not in self.budgets:
+            return
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        waited = False
+        while True:
+            allowed, wait = await self._take(upstream)
+            if allowed:
+                self.counters[upstream]["granted"] += 1
+                if waited:
+                    self.counters[upstream]["waited"] += 1
+                    upstream_rate_limited.inc(upstream, "waited")
+                return
+            if time.monotonic() + wait > deadline:
+                self.counters[upstream]["rejected"] += 1
+                upstream_rate_limited.inc(upstream, "rejected")
+                raise RateLimited(upstream, wait)
+            waited = True
+            # Ostatní čekající mohou token sebrat dřív, pak se čeká znovu
+            await asyncio.sleep(wait)
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        return {
+            upstream: {"rate": budget.rate, "burst": budget.burst, **self.counters[upstream]}
+            for upstream, budget in self.budgets.items()
+        }
+
+
+limiter = RateLimiter()
+
+
+def retry_after_header(error: RateLimited) -> str:
+    return str(max(1, math.ceil(error.retry_after)))
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+import csv
+import logging
+import re
+import sys
+
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+
+logging.basicConfig(
+    format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+
+# Rozšíření slovníku pro právní formy
+legal_forms = {
+    "100": "Podnikající fyzická osoba tuzemská fyzická osoba",
+    "111": "Veřejná obchodní společnost",
+    "112": "Společnost s ručením omezeným",
+    "113": "Společnost komanditní",
+    "114": "Společnost komanditní na akcie",
+    "115": "Společný podnik",
+    "116": "Zájmové sdružení",
+    "117": "Nadace",
+    "118": "Nadační fond",
+    "121": "Akciová společnost",
+    "131": "Svépomocné zemědělské družstvo",
+    "141": "Obecně prospěšná společnost",
+    "145": "Společenství vlastníků jednotek",
+    "151": "Komoditní burza",
+    "152": "Garanční fond obchodníků s cennými papíry",
+    "161": "Ústav",
+    "201": "Zemědělské družstvo",
+    "205": "Družstvo",
+    "211": "Družstevní podnik zemědelský",
+    "231": "Výrobní družstvo",
+    "232": "Spotřební družstvo",
+    "233": "Bytové družstvo",
+    "234": "Jiné družstvo",
+    "241": "Družstevní podnik (s 1 zakladatelem)",
+    "242": "Společný podnik (s více zakladateli)",
+    "251": "Zájmová organizace družstev",
+    "261": "Společná zájmová organizace družstev",
+    "301": "Státní podnik",
+    "302": "Národní podnik",
+    "311": "Státní banka československá",
+    "312": "Banka-státní peněžní ústav",
+    "313": "Česká národní banka",
+    "314": "Česká konsolidační agentura",
+    "325": "Organizační složka státu",
+    "326": "Stálý rozhodčí soud",
+    "331": "Příspěvková organizace zřízená územním samosprávným celkem",
+    "332": "Státní příspěvková organizace",
+    "333": "Státní příspěvková organizace ostatní",
+    "341": "Státní hospodářská organizace řízená okresním úřadem",
+    "343": "Obecní podnik",
+    "351": "Československé státní dráhy-státní organizace",
+    "352": "Správa železniční dopravní cesty, státní organizace",
+    "353": "Rada pro veřejný dohled nad auditem",
+    "361": "Veřejnoprávní instituce",
+    "362": "Česká tisková kancelář",
+    "381": "Státní fond ze zákona",
+    "382": "Státní fond ze zákona nezapisující se do obchodního rejstříku",
+    "391": "Zdravotní pojišťovna (mimo VZP)",
+    "392": "Všeobecná zdravotní pojišťovna",
+    "401": "Sdružení mezinárodního obchodu",
+    "411": "Podnik se zahraniční majetkovou účastí",
+    "421": "Odštěpný závod zahraniční právnické osoby",
+    "422": "Organizační složka zahraničního nadačního fondu",
+    "423": "Organizační složka zahraniční nadace",
+    "424": "Zahraniční fyzická osoba fyzická osoba",
+    "425": "Odštěpný závod zahraniční fyzické osoby",
+    "426": "Zastoupení zahraniční banky",
+    "441": "Podnik zahraničního obchodu",
+    "442": "Účelová zahraničně obchodní organizace",
+    "501": "Odštěpný závod",
+    "521": "Samostatná drobná provozovna (obecního úřadu)",
+    "525": "Vnitřní organizační jednotka organizační složky státu",
+    "601": "Vysoká škola (veřejná, státní)",
+    "641": "Školská právnická osoba",
+    "661": "Veřejná výzkumná instituce",
+    "671": "Veřejné neziskové ústavní zdravotnické zařízení",
+    "701": "Občanské sdružení",
+    "703": "Odborová organizace a organizace zaměstnavatelů",
+    "704": "Zvláštní organizace pro zastoupení českých zájmů v mezinárodních nevládních organizacích",
+    "705": "Podnik nebo hospodářské zařízení sdružení",
+    "706": "Spolek",
+    "707": "Odborová organizace",
+    "708": "Organizace zaměstnavatelů",
+    "711": "Politická strana, politické hnutí",
+    "715": "Podnik nebo hospodářské zařízení politické strany",
+    "721": "Církve a náboženské společnosti",
+    "722": "Evidované církevní právnické osoby",
+    "723": "Svazy církví a náboženských společností",
+    "731": "Organizační jednotka občanského sdružení",
+    "733": "Pobočná odborová organizace a organizace zaměstnavatelů",
+    "734": "Organizační jednotka zvláštní organizace pro zastoupení českých zájmů v mezinárodních nevládních organizacích",
+    "736": "Pobočný spolek",
+    "741": "Samosprávná stavovská organizace (profesní komora)",
+    "745": "Komora (hospodářská, agrární)",
+    "751": "Zájmové sdružení právnických osob",
+    "761": "Honební společenstvo",
+    "771": "Dobrovolný svazek obcí",
+    "801": "Obec",
+    "804": "Kraj",
+    "805": "Regionální rada regionu soudržnosti",
+    "811": "Městská část, městský obvod",
+    "906": "Zahraniční spolek",
+    "907": "Mezinárodní odborová organizace",
+    "908": "Mezinárodní organizace zaměstnavatelů",
+    "921": "Mezinárodní nevládní organizace",
+    "922": "Organizační jednotka mezinárodní nevládní organizace",
+    "931": "Evropské hospodářské zájmové sdružení",
+    "932": "Evropská společnost",
+    "933": "Evropská družstevní společnost",
+    "936": "Zahraniční pobočný spolek",
+    "937": "Pobočná mezinárodní odborová organizace",
+    "938": "Pobočná mezinárodní organizace zaměstnavatelů",
+    "941": "Evropské seskupení pro územní spolupráci",
+    "960": "Právnická osoba zřízená zvláštním zákonem zapisovaná do veřejného rejstříku",
+    "961": "Svěřenský fond",
+    "962": "Zahraniční svěřenský fond"
+}
+
+
+# Sekce CZ-NACE a rozsahy oddílů (dvoumístných kódů), které do nich patří
+nace_sections = {
+    "A": "Zemědělství, lesnictví, rybářství",
+    "B": "Těžba a dobývání",
+    "C": "Zpracovatelský průmysl",
+    "D": "Výroba a rozvod elektřiny, plynu, tepla a klimatizovaného vzduchu",
+    "E": "Zásobování vodou; činnosti související s odpadními vodami, odpady a sanacemi",
+    "F": "Stavebnictví",
+    "G": "Velkoobchod a maloobchod; opravy a údržba motorových vozidel",
+    "H": "Doprava a skladování",
+    "I": "Ubytování, stravování a pohostinství",
+    "J": "Informační a komunikační činnosti",
+    "K": "Peněžnictví a pojišťovnictví",
+    "L": "Činnosti v oblasti nemovitostí",
+    "M": "Profesní, vědecké a technické činnosti",
+    "N": "Administrativní a podpůrné činnosti",
+    "O": "Veřejná správa a obrana; povinné sociální zabezpečení",
+    "P": "Vzdělávání",
+    "Q": "Zdravotní a sociální péče",
+    "R": "Kulturní, zábavní a rekreační činnosti",
+    "S": "Ostatní činnosti",
+    "T": "Činnosti domácností jako zaměstnavatelů; činnosti domácností produkujících blíže neurčené výrobky a služby pro vlastní potřebu",
+    "U": "Činnosti exteritoriálních organizací a orgánů",
+}
+
+nace_section_divisions = (
+    ("A", 1, 3),
+    ("B", 5, 9),
+    ("C", 10, 33),
+    ("D", 35, 35),
+    ("E", 36, 39),
+    ("F", 41, 43),
+    ("G", 45, 47),
+    ("H", 49, 53),
+    ("I", 55, 56),
+    ("J", 58, 63),
+    ("K", 64, 66),
+    ("L", 68, 68),
+    ("M", 69, 75),
+    ("N", 77, 82),
+    ("O", 84, 84),
+    ("P", 85, 85),
+    ("Q", 86, 88),
+    ("R", 90, 93),
+    ("S", 94, 96),
+    ("T", 97, 98),
+    ("U", 99, 99),
+)
+
+NACE_LEVELS = {1: "section", 2: "division", 3: "group", 4: "class", 5: "subclass"}
+
+
+@dataclass(frozen=True)
+class NaceNode:
+    code: str
+    level: str
+    description: str
+
+    @property
+    def label(self) -> str:
+        return f"{self.code} - {self.description}"
+
+
+class CzNaceIndex:
+    """
+    Hierarchical CZ-NACE index.
+
+    Every known code maps to its precomputed ancestor chain
+    (section -> division -> group -> class -> subclass), so resolving a code
+    is a single dict lookup. Codes more specific than the code list resolve to
+    their longest known prefix.
+    """
+
+    _code_pattern = re.compile(r"\s*([A-Za-z](?![A-Za-z])|[\d.]+)")
+
+    def __init__(self, rows: Iterable[Tuple[str, str]]):
+        sections = {
+            letter: NaceNode(letter, NACE_LEVELS[1], sys.intern(description))
+            for letter, description in nace_sections.items()
+        }
+        division_sections = {
+            f"{division:02d}": sections[letter]
+            for letter, first, last in nace_section_divisions
+            for division in range(first, last + 1)
+        }
+
+        chains: Dict[str, Tuple[NaceNode, ...]] = {
+            letter: (node,) for letter, node in sections.items()
+        }
+        aliases: Dict[str, str] = {}
+        division_raw = None
+        for raw_code, description in rows:
+            if not raw_code.isdigit() or raw_code == "0":
+                continue
+            # V číselníku chybí úvodní nuly (např. "111" je skupina 01.1, ne 11.1),
+            # proto se oddíl určuje podle pořadí řádků.
+            if division_raw is not None and len(raw_code) > len(division_raw) and raw_code.startswith(division_raw):
+                code = raw_code.zfill(len(raw_code) + 2 - len(division_raw))
+            else:
+                division_raw = raw_code
+                code = raw_code.zfill(2)
+            aliases.setdefault(raw_code, code)
+
+            level = NACE_LEVELS.get(len(code))
+            section = division_sections.get(code[:2])
+            if level is None or section is None or code in chains:
+                continue
+            parent = next(
+                (chains[code[:length]] for length in range(len(code) - 1, 1, -1) if code[:length] in chains),
+                (section,),
+            )
+            chains[code] = parent + (NaceNode(code, level, sys.intern(description)),)
+
+        self._chains = MappingProxyType(chains)
+        self._aliases = MappingProxyType(aliases)
+
+    def __len__(self) -> int:
+        return len(self._chains)
+
+    def resolve(self, code: Optional[str]) -> Tuple[NaceNode, ...]:
+        """
+        Resolve a CZ-NACE code to its ancestor chain.
+
+        Parameters:
+        code (str): Section letter or numeric code, optionally with dots or a
+            trailing description (e.g. "62.01", "62010 - Programování").
+
+        Returns:
+        Tuple[NaceNode, ...]: Chain from section down to the code itself,
+            empty if the code is unknown.
+        """
+        match = self._code_pattern.match(code or "")
+        if match is None:
+            return ()
+        key = match.group(1).replace(".", "").upper()
+
+        chain = self._chains.get(key)
+        if chain is None and key in self._aliases:
+            chain = self._chains.get(self._aliases[key])
+        if chain is None:
+            chain = next(
+                (self._chains[key[:length]] for length in range(len(key) - 1, 1, -1) if key[:length] in self._chains),
+                (),
+            )
+        return chain
+
+    def resolve_many(self, codes: Iterable[str]) -> Dict[str, Tuple[NaceNode, ...]]:
+        return {code: self.resolve(code) for code in codes}
+
+    def section(self, code: Optional[str]) -> Optional[NaceNode]:
+        chain = self.resolve(code)
+        return chain[0] if chain else None
+
+
+@dataclass(frozen=True)
+class ReferenceData:
+    """
+    Read-only lookup tables used to enrich ARES records.
+
+    All tables are plain dicts wrapped in MappingProxyType, so lookups are O(1)
+    and the registry can be shared freely between requests and threads.
+    """
+    cznace: Mapping[str, str]
+    company_sizes: Mapping[str, str]
+    legal_forms: Mapping[str, str]
+    nace_index: CzNaceIndex
+
+    def describe(self, code: str) -> Optional[str]:
+        description = self.cznace.get(code)
+        if description is None:
+            logging.info(f'Žádný popis pro id_cznace: {code} nebyl nalezen.')
+        return description
+
+    def describe_many(self, codes: Iterable[str]) -> List[str]:
+        """
+        Translate CZ-NACE codes to their descriptions.
+
+        Parameters:
+        codes (Iterable[str]): CZ-NACE codes as returned by ARES.
+
+        Returns:
+        List[str]: Descriptions in input order, unknown codes are left out.
+        """
+        descriptions = []
+        for code in codes:
+            description = self.describe(code)
+            if description is not None:
+                descriptions.append(description)
+        return descriptions
+
+    def company_size(self, chodnota: str) -> Optional[str]:
+        size_text = self.company_sizes.get(chodnota)
+        if size_text is None:
+            logging.info(f'Žádná velikost společnosti pro chodnota: {chodnota} nebyla nalezena.')
+        return size_text
+
+    def legal_form(self, legal_form_code: str) -> str:
+        # Vrátí textovou reprezentaci právní formy, pokud je kód známý, jinak vrátí původní kód
+        return self.legal_forms.get(legal_form_code, legal_form_code)
+
+
+def _read_rows(csv_path: str, delimiter: str, key_column: str, value_column: str) -> List[Tuple[str, str]]:
+    try:
+        with open(csv_path, newline='', encoding='utf-8-sig') as file:
+            return [
+                (sys.intern(row[key_column]), sys.intern(row[value_column]))
+                for row in csv.DictReader(file, delimiter=delimiter)
+            ]
+    except (OSError, KeyError, csv.Error) as e:
+        logging.error(f'Chyba při načítání souboru {csv_path}: {e}')
+        return []
+
+
+def _to_table(rows: Iterable[Tuple[str, str]]) -> Mapping[str, str]:
+    table = {}
+    for key, value in rows:
+        # Při duplicitním klíči platí jeho první výskyt v souboru
+        table.setdefault(key, value)
+    return MappingProxyType(table)
+
+
+@lru_cache(maxsize=None)
+def load_reference_data(
+    cznace_path: str = "cznace.csv", sizes_path: str = "pocet_pracovniku.csv"
+) -> ReferenceData:
+    """
+    Load the reference tables once per set of paths.
+
+    Parameters:
+    cznace_path (str): Path to the CZ-NACE code list (';' separated).
+    sizes_path (str): Path to the employee-count categories (',' separated).
+
+    Returns:
+    ReferenceData: Shared immutable registry.
+    """
+    cznace_rows = _read_rows(cznace_path, ';', 'id_cznace', 'text_cznace')
+    reference_data = ReferenceData(
+        cznace=_to_table(cznace_rows),
+        company_sizes=_to_table(_read_rows(sizes_path, ',', 'chodnota', 'zkrtext')),
+        legal_forms=MappingProxyType(dict(legal_forms)),
+        nace_index=CzNaceIndex(cznace_rows),
+    )
+    logging.info(
+        f"Načteno {len(reference_data.cznace)} kódů CZ-NACE "
+        f"({len(reference_data.nace_index)} uzlů hierarchie) a "
+        f"{len(reference_data.company_sizes)} kategorií počtu pracovníků."
+    )
+    return reference_data
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
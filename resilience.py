@@ -0,0 +1,151 @@
+import asyncio
+import logging
+
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from circuit_breaker import CircuitBreaker
+
+
+logging.basicConfig(
+    format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Z kolika posledních odpovědí se počítá p95 pro hedging
+LATENCY_WINDOW = 200
+# Dokud není dost vzorků, druhý požadavek se neposílá
+HEDGE_MIN_SAMPLES = 20
+
+T = TypeVar("T")
+
+
+class LatencyWindow:
+    """
+    Latencies of the most recent successful requests.
+    """
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+class UpstreamGuard:
+    """
+    Resilience state of one upstream: circuit breaker, latency window and hedging.
+
+    The breaker opens after `failure_threshold` consecutive failures
+    (transport errors, timeouts, 5xx and 429) and requests are then
+    refused until a trial request succeeds, so callers fail fast and fall
+    back to what they have cached.
+    With `hedge` enabled, an idempotent request still running after the
+    upstream's p95 latency gets a second, identical request, and the first
+    answer wins.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 hedge: bool = False, hedge_min_delay: float = 0.05):
+        self.name = name
+        self.breaker = CircuitBreaker(name, failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+        self.latencies = LatencyWindow()
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.counters = {"requests": 0, "failures": 0, "rejected": 0, "deadline_exceeded": 0, "hedged": 0, "hedge_wins": 0, "hedge_skipped": 0}
+
+    def allow_request(self) -> bool:
+        self.counters["requests"] += 1
+        if not self.breaker.allow_request():
+            self.counters["rejected"] += 1
+            return False
+        return True
+
+    def record_success(self, seconds: Optional[float] = None):
+        if seconds is not None:
+            self.latencies.observe(seconds)
+        self.breaker.record_success()
+
+    def record_failure(self):
+        self.counters["failures"] += 1
+        self.breaker.record_failure()
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Returns:
+        float|None: Seconds after which a hedged request is sent, None if hedging is off or there's too little data.
+        """
+        if not self.hedge or len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(self.latencies.percentile(0.95), self.hedge_min_delay)
+
+    async def hedged(self, call: Callable[[], Awaitable[T]], admit: Optional[Callable[[], Awaitable[bool]]] = None) -> T:
+        """
+        Run `call`, starting a second copy of it once the first exceeds hedge_delay().
+
+        Parameters:
+        call: Starts one request.
+        admit: Asked before the second copy starts; when it returns False, only the first call is awaited.
+
+        Returns:
+        The result of whichever call finishes first without an exception.
+        """
+        delay = self.hedge_delay()
+        first = asyncio.ensure_future(call())
+        if delay is None:
+            return await first
+
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+            if admit is not None and not await admit():
+                # Na druhý požadavek nezbyl token z limitu, počká se na první
+                self.counters["hedge_skipped"] += 1
+                return await first
+            self.counters["hedged"] += 1
+            second = asyncio.ensure_future(call())
+            pending.add(second)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.counters["hedge_wins"] += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            # Pomalejší z dvojice se zruší, stejně tak obě při vypršení limitu
+            for task in pending:
+                task.cancel()
+
+    def snapshot(self) -> Dict[str, object]:
+        p50, p95 = self.latencies.percentile(0.5), self.latencies.percentile(0.95)
+        return {
+            **self.breaker.snapshot(),
+            **self.counters,
+            "latency_p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "latency_p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "hedge_delay_ms": round(self.hedge_delay() * 1000, 1) if self.hedge_delay() is not None else None,
+        }
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""
+Reading IČOs from the bulk enrichment input files.
+"""
+from bulk_enrich import read_icos
+
+
+def write_csv(tmp_path, text):
+    path = tmp_path / "input.csv"
+    # Excel ukládá CSV v UTF-8 s BOM
+    path.write_bytes(b"\xef\xbb\xbf" + text.encode("utf-8"))
+    return str(path)
+
+
+def test_headerless_csv_with_bom_keeps_the_first_ico(tmp_path):
+    path = write_csv(tmp_path, "27405354\r\n27405362\r\n")
+    assert list(read_icos(path)) == ["27405354", "27405362"]
+
+
+def test_csv_with_bom_finds_the_named_column(tmp_path):
+    path = write_csv(tmp_path, "ico,name\r\n27405354,Firma\r\n")
+    assert list(read_icos(path, column="ico")) == ["27405354"]
@@ -0,0 +1,206 @@
+"""
+POST /companies and GET /company against a local stub of ARES.
+
+Redis is switched off for the tests, so the cache runs on its in-process
+L1 and the ARES rate limit on the local token bucket.
+"""
+import os
+import asyncio
+
+import httpx
+import pytest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import ares
+import http_client
+import main
+
+from ares_mirror import AresMirror
+from cache import L1_MAX_ENTRIES, L1_TTL, LocalCache, cache
+from name_search import NameIndex
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# IČO se správným kontrolním součtem
+KNOWN_ICOS = ["27405354", "27405362", "27405389", "27405397", "00006947"]
+UNKNOWN_ICO = "27405371"
+# Dávka obsahující toto IČO skončí v ARES chybou 500
+FAILING_ICO = "27405401"
+
+
+def company_record(ico):
+    return {
+        "ico": ico,
+        "obchodniJmeno": f"Firma {ico} s.r.o.",
+        "sidlo": {"textovaAdresa": "Vinohradská 2828/151, 13000 Praha 3", "psc": 13000},
+        "pravniForma": "112",
+        "czNace": ["62010"],
+        "statistickeUdaje": {},
+    }
+
+
+class StubAres:
+    def __init__(self):
+        self.requests = []
+        self.app = web.Application()
+        self.app.router.add_post("/ekonomicke-subjekty/vyhledat", self.search)
+        self.app.router.add_get("/ekonomicke-subjekty-res/{ico}", self.detail)
+
+    async def search(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        self.requests.append(payload["ico"])
+        if FAILING_ICO in payload["ico"]:
+            return web.json_response({"kod": "CHYBA"}, status=500)
+        records = [company_record(ico) for ico in payload["ico"] if ico in KNOWN_ICOS]
+        return web.json_response({"pocetCelkem": len(records), "ekonomickeSubjekty": records})
+
+    async def detail(self, request: web.Request) -> web.Response:
+        ico = request.match_info["ico"]
+        self.requests.append([ico])
+        if ico == FAILING_ICO:
+            return web.json_response({"kod": "CHYBA"}, status=500)
+        if ico not in KNOWN_ICOS:
+            return web.json_response({"kod": "NENALEZENO"}, status=404)
+        return web.json_response({"zaznamy": [company_record(ico)]})
+
+    def requested_icos(self):
+        return [ico for chunk in self.requests for ico in chunk]
+
+
+@pytest.fixture
+def isolated(monkeypatch, tmp_path):
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(cache, "redis", None)
+    monkeypatch.setattr(cache, "local", LocalCache(L1_MAX_ENTRIES, L1_TTL))
+    monkeypatch.setattr(ares, "ares_mirror", AresMirror(str(tmp_path / "missing.sqlite3")))
+    monkeypatch.setattr(ares, "name_index", NameIndex())
+    monkeypatch.setattr(ares, "ARES_BULK_CHUNK_SIZE", 2)
+    monkeypatch.setattr(http_client, "_guards", {})
+    monkeypatch.setattr(main, "czso_get_cz_nace", no_cz_nace)
+
+
+async def no_cz_nace(ico):
+    return None
+
+
+async def post(client, icos):
+    response = await client.post("/companies", json=icos)
+    assert response.status_code == 200
+    return response.json()
+
+
+def run_with_stub(monkeypatch, scenario):
+    """
+    Start the stub, point ARES_BASE_URL at it and run `scenario(client, stub)`.
+    """
+    async def run():
+        stub = StubAres()
+        server = TestServer(stub.app)
+        await server.start_server()
+        monkeypatch.setattr(ares, "ares_base_url", str(server.make_url("")).rstrip("/"))
+        transport = httpx.ASGITransport(app=main.app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                await scenario(client, stub)
+        finally:
+            await http_client.aclose()
+            await server.close()
+
+    asyncio.run(run())
+
+
+def test_duplicates_are_looked_up_once_and_input_order_is_kept(isolated, monkeypatch):
+    async def scenario(client, stub):
+        result = await post(client, ["27405362", "27405354", "27405362"])
+        assert list(result) == ["27405362", "27405354"]
+        assert result["27405354"]["company"]["name"] == "Firma 27405354 s.r.o."
+        assert result["27405362"]["company"]["legal_form"] == "Společnost s ručením omezeným"
+        assert sorted(stub.requested_icos()) == ["27405354", "27405362"]
+
+    run_with_stub(monkeypatch, scenario)
+
+
+def test_invalid_icos_get_their_own_errors(isolated, monkeypatch):
+    async def scenario(client, stub):
+        result = await post(client, ["27405355", " 27405354", "27405354"])
+        assert result["27405355"] == {"company": None, "error": "Invalid ICO"}
+        assert result[" 27405354"] == {"company": None, "error": "IČ number should not contain spaces."}
+        assert result["27405354"]["company"]["ico"] == "27405354"
+        assert stub.requested_icos() == ["27405354"]
+
+    run_with_stub(monkeypatch, scenario)
+
+
+def test_icos_missing_from_the_chunk_are_not_found(isolated, monkeypatch):
+    async def scenario(client, stub):
+        result = await post(client, ["27405354", UNKNOWN_ICO])
+        assert result["27405354"]["company"] is not None
+        assert result[UNKNOWN_ICO] == {"company": None, "error": "IČO doesn´t found."}
+
+    run_with_stub(monkeypatch, scenario)
+
+
+def test_failing_chunk_only_fails_its_own_icos(isolated, monkeypatch):
+    async def scenario(client, stub):
+        result = await post(client, ["27405354", "27405362", FAILING_ICO, "27405389"])
+        assert len(stub.requests) == 2
+        assert result["27405354"]["company"] is not None
+        assert result["27405362"]["company"] is not None
+        assert result[FAILING_ICO] == {"company": None, "error": "ARES request failed."}
+        assert result["27405389"] == {"company": None, "error": "ARES request failed."}
+
+    run_with_stub(monkeypatch, scenario)
+
+
+def test_repeated_call_is_served_from_the_cache(isolated, monkeypatch):
+    icos = ["27405354", "27405362", "27405389", UNKNOWN_ICO]
+
+    async def scenario(client, stub):
+        first = await post(client, icos)
+        requests = len(stub.requests)
+        assert requests == 2
+        second = await post(client, icos)
+        assert second == first
+        assert len(stub.requests) == requests
+
+    run_with_stub(monkeypatch, scenario)
+
+
+def test_short_ico_is_looked_up_zero_padded(isolated, monkeypatch):
+    async def scenario(client, stub):
+        response = await client.get("/company/6947")
+        assert response.status_code == 200
+        assert response.json()["ico"] == "00006947"
+        assert stub.requested_icos() == ["00006947"]
+        response = await client.get("/company/00006947")
+        assert response.status_code == 200
+        assert stub.requested_icos() == ["00006947"]
+
+    run_with_stub(monkeypatch, scenario)
+
+
+def test_ares_outage_is_not_reported_as_not_found(isolated, monkeypatch):
+    async def scenario(client, stub):
+        response = await client.get(f"/company/{FAILING_ICO}")
+        assert response.status_code == 503
+        response = await client.get(f"/company/{UNKNOWN_ICO}")
+        assert response.status_code == 404
+        # ARES neodpovídá vůbec
+        monkeypatch.setattr(ares, "ares_base_url", "http://127.0.0.1:9")
+        response = await client.get("/company/27405362")
+        assert response.status_code == 503
+
+    run_with_stub(monkeypatch, scenario)
+
+
+def test_only_the_api_feeds_the_name_index(isolated, monkeypatch):
+    async def scenario(client, stub):
+        # bulk_enrich index nepotřebuje, názvy by jen zabíraly paměť
+        results = await ares.get_companies_data_ares(["27405354"], index_names=False)
+        assert results["27405354"].company is not None
+        assert len(ares.name_index) == 0
+        await post(client, ["27405362"])
+        assert [result["ico"] for result in ares.name_index.search("firma 27405362")] == ["27405362"]
+
+    run_with_stub(monkeypatch, scenario)
@@ -0,0 +1,58 @@
+"""
+GET /debug/czso-html returns the raw ČSÚ page kept in the debug tier.
+
+The tier lives only in Redis, so the test needs fakeredis.
+"""
+import os
+import asyncio
+
+import httpx
+import pytest
+
+import czso
+import main
+
+from cache import L1_MAX_ENTRIES, L1_TTL, LocalCache, cache
+
+fakeredis = pytest.importorskip("fakeredis")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGE_PATH = os.path.join(ROOT, "benchmarks", "fixtures", "czso", "programovani.html")
+ICO = "27405354"
+
+
+@pytest.fixture
+def debug_tier(monkeypatch):
+    monkeypatch.setattr(cache, "redis", fakeredis.FakeAsyncRedis())
+    monkeypatch.setattr(cache, "local", LocalCache(L1_MAX_ENTRIES, L1_TTL))
+    monkeypatch.setattr(czso, "CZSO_DEBUG_HTML_TTL", 60)
+    with open(PAGE_PATH, "rb") as file:
+        page = file.read()
+
+    async def website_content(ico):
+        return page
+
+    monkeypatch.setattr(czso, "czso_get_website_content", website_content)
+    return page
+
+
+def get(path):
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(path)
+
+    return asyncio.run(run())
+
+
+def test_page_fetched_for_cz_nace_is_served_raw(debug_tier):
+    assert asyncio.run(czso.czso_fetch_cz_nace(ICO, f"czso_cz_nace:{ICO}"))
+    response = get(f"/debug/czso-html/{ICO}")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/html")
+    assert response.content == debug_tier
+
+
+def test_page_not_kept_is_404(debug_tier):
+    assert get(f"/debug/czso-html/{ICO}").status_code == 404
+    assert get("/debug/czso-html/27405355").status_code == 400
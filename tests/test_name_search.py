@@ -0,0 +1,49 @@
+"""
+Searching the company name index, with and without typos.
+"""
+import pytest
+
+from name_search import NameIndex
+
+
+@pytest.fixture
+def index():
+    index = NameIndex()
+    index.add("27405354", "Žluťoučký kůň s.r.o.")
+    index.add("27405362", "Zlatý kůň a.s.")
+    index.add("27405389", "Pražská plynárenská, a.s.")
+    return index
+
+
+def icos(results):
+    return [result["ico"] for result in results]
+
+
+def test_exact_and_prefix_matches(index):
+    assert icos(index.search("zlutoucky")) == ["27405354"]
+    assert icos(index.search("praz plyn")) == ["27405389"]
+    assert icos(index.search("kun")) == ["27405362", "27405354"]
+
+
+@pytest.mark.parametrize("query, ico", [
+    ("zlutocky", "27405354"),
+    ("zlutockyy", "27405354"),
+    ("zlutuocky kun", "27405354"),
+    ("plynarnska", "27405389"),
+])
+def test_words_with_typos_are_found(index, query, ico):
+    assert icos(index.search(query)) == [ico]
+
+
+def test_typo_matches_score_below_exact_matches(index):
+    exact, = index.search("zlutoucky")
+    one_typo, = index.search("zlutocky")
+    two_typos, = index.search("zlutockyy")
+    assert exact["score"] > one_typo["score"] > two_typos["score"]
+
+
+def test_typos_are_limited_by_word_length(index):
+    # Krátká slova se s překlepem nehledají, delší nejvýš se dvěma úpravami
+    assert index.search("kin") == []
+    assert index.search("zlotackyy") == []
+    assert index.search("xlutoucky") == []
@@ -0,0 +1,156 @@
+import os
+import time
+import logging
+
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+
+logging.basicConfig(
+    format="[%(asctime)s +0000] [%(process)d] [%(levelname)s] %(message)s",
+    level=logging.INFO,
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+# Do ladicího bufferu se dostanou jen požadavky pomalejší než tento limit
+TRACE_SLOW_SECONDS = float(os.environ.get("TRACE_SLOW_SECONDS", 0.5))
+# Kolik posledních pomalých požadavků se drží v paměti
+TRACE_BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER_SIZE", 100))
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+
+
+class Trace:
+    """
+    Timing of one API request, split into named spans.
+
+    Spans are (name, offset from the request start, duration) in seconds.
+    Tasks started by the request copy its context, so spans of concurrent
+    stages (ARES and ČSÚ) end up in the same trace and may overlap.
+    """
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans: List[Tuple[str, float, float]] = []
+        self.duration: Optional[float] = None
+        self.status: Optional[int] = None
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def finish(self, status: Optional[int]):
+        self.duration = self.elapsed()
+        self.status = status
+
+    def server_timing(self) -> str:
+        """
+        Returns:
+        str: Value of the Server-Timing header; repeated spans are summed under one name.
+        """
+        totals: Dict[str, float] = {}
+        for name, _, duration in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration
+        entries = [f"{name};dur={duration * 1000:.2f}" for name, duration in totals.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.2f}")
+        return ", ".join(entries)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round((self.duration or 0.0) * 1000, 2),
+            "spans": [
+                {"name": name, "offset_ms": round(offset * 1000, 2), "duration_ms": round(duration * 1000, 2)}
+                for name, offset, duration in self.spans
+            ],
+        }
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """
+    Time a block as a span of the current request; does nothing outside of a request.
+
+    Parameters:
+    name (str): Name of the span, reported in Server-Timing, so no spaces or commas.
+    """
+    trace = _current_trace.get()
+    # Úlohy na pozadí (obnova cache) mohou doběhnout až po odpovědi
+    if trace is None or trace.duration is not None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append((name, started - trace.started, time.perf_counter() - started))
+
+
+class SlowRequestBuffer:
+    """
+    Bounded buffer of recent requests slower than `threshold` seconds.
+    """
+
+    def __init__(self, threshold: float = TRACE_SLOW_SECONDS, size: int = TRACE_BUFFER_SIZE):
+        self.threshold = threshold
+        self.traces: Deque[Trace] = deque(maxlen=size)
+
+    def record(self, trace: Trace):
+        if trace.duration is not None and trace.duration >= self.threshold:
+            self.traces.append(trace)
+
+    def slowest(self, limit: Optional[int] = None) -> List[Dict[str, object]]:
+        traces = sorted(self.traces, key=lambda trace: trace.duration, reverse=True)
+        return [trace.as_dict() for trace in traces[:limit]]
+
+
+slow_requests = SlowRequestBuffer()
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware starting a Trace for every request and reporting its spans
+    in the Server-Timing response header.
+    """
+
+    def __init__(self, app, buffer: SlowRequestBuffer = slow_requests):
+        self.app = app
+        self.buffer = buffer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(scope["method"], scope["path"])
+        token = _current_trace.set(trace)
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            trace.finish(trace.status or 500)
+            self.buffer.record(trace)
+
+
+def main():
+    pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,12 @@
 import os
-import requests
-import json
-import redis
 import logging
 
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
+
+import http_client
+
+from cache import cache, negative_entry, parse_negative_entry
+from codec import DataclassCodec, SchemaMismatch
 
 
 logging.basicConfig(
@@ -13,6 +15,20 @@ logging.basicConfig(
     datefmt="%Y-%m-%d %H:%M:%S",
 )
 
+# Neplatné DIČ se pamatuje kratší dobu než platné
+VAT_TTL = 7 * 24 * 60 * 60
+VAT_NEGATIVE_TTL = int(os.environ.get("VAT_NEGATIVE_TTL", 60 * 60))
+VAT_INVALID = "vat-invalid"
+# Chyby VIES, které znamenají nedostupnou službu, ne neplatné číslo
+VAT_TRANSIENT_ERRORS = {
+    "MS_UNAVAILABLE",
+    "SERVICE_UNAVAILABLE",
+    "TIMEOUT",
+    "SERVER_BUSY",
+    "MS_MAX_CONCURRENT_REQ",
+    "GLOBAL_MAX_CONCURRENT_REQ",
+}
+
 
 def default_headers():
     return {
@@ -32,7 +48,17 @@ class Company:
     vatNumber: str = None
 
 
-redis_host_name = os.environ.get("REDIS_HOST_NAME", "localhost")
+# Při přejmenování nebo přeházení polí Company je potřeba zvýšit verzi
+company_codec = DataclassCodec(Company, version=1)
+
+
+def decode_company(cached_data: bytes) -> Company:
+    negative = parse_negative_entry(cached_data)
+    if negative is not None:
+        # Neplatné DIČ nese v sobě odpověď, aby se vrátila stejná chyba
+        cached_data = negative[1]
+    return company_codec.decode(cached_data)
+
 
 @dataclass
 class VatInfo:
@@ -42,16 +68,22 @@ class VatInfo:
     def __post_init__(self):
         self.country = self.vat_input[:2]
         self.vat_number = self.vat_input[2:]
-        self.redis_db = redis.Redis(host=redis_host_name, port=6379, db=0)
 
-    def get_vat_info(self):
+    async def get_vat_info(self):
         redis_key = f'vat_info:{self.country}:{self.vat_number}'
-        cached_data = self.redis_db.get(redis_key)
+        cached_data = await cache.get(redis_key)
         
         if cached_data is not None:
-            logging.info("Used cache data!")
-            return Company(**json.loads(cached_data))
+            try:
+                company = decode_company(cached_data)
+                logging.info("Used cache data!")
+                return company
+            except SchemaMismatch as e:
+                logging.info(f"Cached VAT info in an old format, fetching again: {e}")
 
+        return await cache.coalesce(redis_key, lambda: self.fetch_vat_info(redis_key), decode_company)
+
+    async def fetch_vat_info(self, redis_key: str):
         headers = {
             'Accept': 'application/json',
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/113.0.0.0 Safari/537.36',
@@ -60,7 +92,12 @@ class VatInfo:
             'country': self.country,
             'vatNumber': self.vat_number
         }
-        response = requests.get(self.base_url, headers=headers, params=params)
+        try:
+            response = await http_client.get("vat", self.base_url, headers=headers, params=params)
+        except http_client.HttpError as e:
+            # Výpadek služby neznamená neexistující firmu
+            logging.error(f"Request to {self.base_url} failed: {e}")
+            raise
 
         if response.status_code == 200:
             data = response.json()
@@ -78,11 +115,14 @@ class VatInfo:
             )
 
             if company.isValid:
-                self.redis_db.setex(redis_key, 7 * 24 * 60 * 60, json.dumps(asdict(company)))
-                return company
+                await cache.set(redis_key, company_codec.encode(company), ttl=VAT_TTL)
+            elif company.userError not in VAT_TRANSIENT_ERRORS:
+                await cache.set(redis_key, negative_entry(VAT_INVALID, company_codec.encode(company)), ttl=VAT_NEGATIVE_TTL)
 
             return company
 
+        if response.status_code >= 500 or response.status_code == 429:
+            response.raise_for_status()
         return None
 
 